@@ -8,19 +8,24 @@ from dotenv import load_dotenv
 
 # from models import db,User
 from models import User
-from extensions import db,cache,jwt
+from extensions import db,cache,jwt,redis_client,stream_redis_client
 
-from resources.admin import AdminDashboardResource,AdminCustomersResource,AdminProfessionalsResource
+from resources.admin import AdminDashboardResource,AdminCustomersResource,AdminProfessionalsResource,AdminReportRunsResource
 from resources.auth import UserRegister, UserLogin, UserRefresh, UserLogout
 from resources.customer import CustomerResource, CustomerListResource
-from resources.export import ExportResource
+from resources.export import ExportResource, ExportStatusResource, ExportDownloadResource
 from resources.professional import ProfessionalResource, ProfessionalListResource, ProfessionalVerificationResource
 from resources.service import ServiceResource, ServiceListResource
 from resources.service_request import ServiceRequestResource,ServiceRequestActionResource,ServiceRequestListResource,RejectedServiceRequest,RejectedServiceRequestResource
-from resources.notification import NotificationResource, NotificationListResource
+from resources.notification import NotificationResource, NotificationListResource, NotificationBulkResource, NotificationUnreadCountResource, NotificationStreamResource
 from resources.review import ReviewListResource,ReviewResource
 
 from mail_config import init_mail
+from blocklist import init_blocklist
+from stats import init_stats
+from notifications import init_notifications
+from templating import init_templating
+from commands import register_commands
 
 # celery
 from celery_config import create_celery_app
@@ -45,8 +50,42 @@ def create_app(test_config=None):
 
 
             CACHE_TYPE='RedisCache',
-            CACHE_REDIS_URL=os.environ.get('REDIS_URL', 'redis://localhost:6379/0'),
+            # Kept apart from the Celery broker DB so cache entries never share a keyspace with queues
+            CACHE_REDIS_URL=os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/1'),
             CACHE_DEFAULT_TIMEOUT=30,
+            # Browsers revalidate catalog reads with If-None-Match; raise to let them skip the request entirely
+            HTTP_CACHE_MAX_AGE=int(os.environ.get('HTTP_CACHE_MAX_AGE', 0)),
+            # ETags also roll over this often, so a write that missed invalidate() can't be served as 304 forever
+            HTTP_ETAG_MAX_AGE=int(os.environ.get('HTTP_ETAG_MAX_AGE', 300)),
+
+            # Seconds between keepalive frames, and before a notification stream is closed for the client to resume
+            NOTIFICATION_STREAM_HEARTBEAT=15,
+            NOTIFICATION_STREAM_TIMEOUT=300,
+            # Open streams per process; beyond this new streams get a 503 and EventSource retries
+            NOTIFICATION_STREAM_MAX_CONNECTIONS=int(os.environ.get('NOTIFICATION_STREAM_MAX_CONNECTIONS', 1000)),
+
+            # Read notifications older than this are archived ('archive') or dropped ('delete') nightly
+            NOTIFICATION_RETENTION_DAYS=int(os.environ.get('NOTIFICATION_RETENTION_DAYS', 90)),
+            NOTIFICATION_RETENTION_MODE=os.environ.get('NOTIFICATION_RETENTION_MODE', 'archive'),
+            NOTIFICATION_RETENTION_BATCH_SIZE=1000,
+            NOTIFICATION_RETENTION_BATCH_PAUSE=0.1,
+
+            # Upper bound for ?shards= on exports; roughly the number of worker processes
+            EXPORT_MAX_SHARDS=int(os.environ.get('EXPORT_MAX_SHARDS', 16)),
+            # Delta exports reach this far back before the previous watermark, so rows whose
+            # transaction committed after that export had read the table are not missed
+            EXPORT_DELTA_OVERLAP=int(os.environ.get('EXPORT_DELTA_OVERLAP', 300)),
+            # Emailed download links are signed with SECRET_KEY and expire after this many seconds
+            EXPORT_LINK_MAX_AGE=int(os.environ.get('EXPORT_LINK_MAX_AGE', 7 * 24 * 3600)),
+            # Internal nginx location mapped to static/exports; when set, nginx serves downloads via
+            # X-Accel-Redirect. Behind Apache/lighttpd set USE_X_SENDFILE instead.
+            EXPORT_ACCEL_REDIRECT_PREFIX=os.environ.get('EXPORT_ACCEL_REDIRECT_PREFIX'),
+            USE_X_SENDFILE=os.environ.get('USE_X_SENDFILE', 'false').lower() == 'true',
+            # Base of links in emails, which are built outside any request
+            PUBLIC_BASE_URL=os.environ.get('PUBLIC_BASE_URL', 'http://localhost:5000'),
+
+            # Optional directory for compiled template bytecode shared by worker processes
+            TEMPLATE_BYTECODE_CACHE_DIR=os.environ.get('TEMPLATE_BYTECODE_CACHE_DIR'),
 
             MAIL_SERVER=('localhost'),
             MAIL_PORT=1025,
@@ -63,12 +102,19 @@ def create_app(test_config=None):
     db.init_app(app)
     
     jwt.init_app(app)
+    init_blocklist(app)
     cache.init_app(app)
+    redis_client.init_app(app)
+    stream_redis_client.init_app(app, max_connections=app.config.get('NOTIFICATION_STREAM_MAX_CONNECTIONS', 1000))
+    init_stats(app)
+    init_notifications(app)
 
     api = Api(app)
     celery = create_celery_app(app)
     app.celery = celery
     init_mail(app)
+    init_templating(app)
+    register_commands(app)
     
     
     os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'documents'), exist_ok=True)
@@ -86,7 +132,10 @@ def create_app(test_config=None):
     api.add_resource(AdminDashboardResource, '/api/admin/dashboard')
     api.add_resource(AdminProfessionalsResource, '/api/admin/professionals')
     api.add_resource(AdminCustomersResource, '/api/admin/customers')
+    api.add_resource(AdminReportRunsResource, '/api/admin/report-runs')
     api.add_resource(ExportResource, '/api/admin/export')
+    api.add_resource(ExportStatusResource, '/api/admin/export/<int:export_id>')
+    api.add_resource(ExportDownloadResource, '/api/admin/export/<int:export_id>/download')
 
     # Customer endpoints
     api.add_resource(CustomerResource, '/api/customers/<int:customer_id>')
@@ -116,6 +165,9 @@ def create_app(test_config=None):
 
     # Notification endpoints
     api.add_resource(NotificationListResource, '/api/notifications')
+    api.add_resource(NotificationBulkResource, '/api/notifications/bulk')
+    api.add_resource(NotificationUnreadCountResource, '/api/notifications/unread-count')
+    api.add_resource(NotificationStreamResource, '/api/notifications/stream')
     api.add_resource(NotificationResource, '/api/notifications/<int:notification_id>')
 
 
@@ -0,0 +1,146 @@
+import hashlib
+import math
+import os
+import threading
+import time
+import redis
+from extensions import jwt, redis_client
+
+REVOKED_KEY_PREFIX = 'auth:revoked:'
+REVOKED_CHANNEL = 'auth:revoked'
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings (no false negatives, tunable false positives)"""
+
+    def __init__(self, capacity, error_rate):
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class RevokedTokens:
+    """
+    Process-local view of revoked token jtis.
+
+    Redis is the source of truth (one key per jti, expiring with the token). Each process
+    mirrors it into a Bloom filter kept current over pub/sub, so a token that was never
+    revoked is accepted without a network round trip; only filter hits are confirmed in Redis.
+    """
+
+    def __init__(self):
+        self._filter = None
+        self._lock = threading.Lock()
+        self._pid = None
+        self.app = None
+
+    def init_app(self, app):
+        app.config.setdefault('REVOKED_TOKENS_CAPACITY', 100000)
+        app.config.setdefault('REVOKED_TOKENS_ERROR_RATE', 0.001)
+        # Rebuilding drops jtis whose tokens have expired anyway
+        app.config.setdefault('REVOKED_TOKENS_REBUILD_INTERVAL', 3600)
+        self.app = app
+        app.extensions['revoked_tokens'] = self
+
+    def _new_filter(self):
+        return BloomFilter(
+            self.app.config['REVOKED_TOKENS_CAPACITY'],
+            self.app.config['REVOKED_TOKENS_ERROR_RATE']
+        )
+
+    def _ensure_listener(self):
+        # Started lazily so forked workers each get their own thread
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._filter = None
+            self._pid = os.getpid()
+            threading.Thread(target=self._listen, name='revoked-tokens', daemon=True).start()
+
+    def _listen(self):
+        rebuild_interval = self.app.config['REVOKED_TOKENS_REBUILD_INTERVAL']
+        while True:
+            try:
+                pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+                # Subscribe before scanning so nothing revoked in between is missed
+                pubsub.subscribe(REVOKED_CHANNEL)
+                self._rebuild()
+                rebuilt_at = time.monotonic()
+
+                while True:
+                    message = pubsub.get_message(timeout=5)
+                    if message and message['type'] == 'message':
+                        self._filter.add(message['data'])
+                    if time.monotonic() - rebuilt_at > rebuild_interval:
+                        self._rebuild()
+                        rebuilt_at = time.monotonic()
+
+            except redis.RedisError as e:
+                # Until we are back in sync every check goes to Redis
+                self._filter = None
+                self.app.logger.warning(f"Revoked token listener disconnected: {str(e)}")
+                time.sleep(5)
+
+    def _rebuild(self):
+        bloom = self._new_filter()
+        for key in redis_client.scan_iter(match=REVOKED_KEY_PREFIX + '*', count=1000):
+            bloom.add(key[len(REVOKED_KEY_PREFIX):])
+        self._filter = bloom
+
+    def is_revoked(self, jti):
+        self._ensure_listener()
+        bloom = self._filter
+
+        if bloom is not None and jti not in bloom:
+            return False
+
+        try:
+            return bool(redis_client.exists(REVOKED_KEY_PREFIX + jti))
+        except redis.RedisError as e:
+            self.app.logger.error(f"Could not check token revocation: {str(e)}")
+            # A filter hit is almost certainly a real revocation; without a filter we fail open
+            return bloom is not None
+
+    def revoke(self, jwt_payload):
+        """Revoke a decoded token until it would have expired on its own"""
+        ttl = int(jwt_payload['exp'] - time.time())
+        if ttl <= 0:
+            return
+
+        jti = jwt_payload['jti']
+        pipe = redis_client.pipeline()
+        pipe.set(REVOKED_KEY_PREFIX + jti, 1, ex=ttl)
+        pipe.publish(REVOKED_CHANNEL, jti)
+        pipe.execute()
+
+        if self._filter is not None:
+            self._filter.add(jti)
+
+
+revoked_tokens = RevokedTokens()
+
+
+@jwt.token_in_blocklist_loader
+def check_if_token_revoked(jwt_header, jwt_payload):
+    return revoked_tokens.is_revoked(jwt_payload['jti'])
+
+
+def init_blocklist(app):
+    """Enable token revocation checks for the Flask app"""
+    revoked_tokens.init_app(app)
+    return revoked_tokens
@@ -0,0 +1,188 @@
+from functools import wraps
+import hashlib
+import math
+import random
+import time
+import uuid
+from flask import Response, current_app, request
+from extensions import cache
+
+TAG_KEY = 'tag:{}'
+LOCK_KEY = 'lock:{}'
+
+# How long one worker may hold the recompute lock, and how long others wait when nothing is cached
+LOCK_TIMEOUT = 10
+LOCK_WAIT = 2.0
+LOCK_POLL_INTERVAL = 0.05
+# XFetch beta: >1 refreshes earlier, <1 later
+EARLY_REFRESH_BETA = 1.0
+
+SERVICES_LIST = 'services_list'
+PROFESSIONALS_LIST = 'professionals_list'
+CUSTOMERS_LIST = 'customers_list'
+
+
+def service_tag(service_id):
+    return f'service:{service_id}'
+
+
+def professional_tag(professional_id):
+    return f'professional:{professional_id}'
+
+
+def professional_tags(professional):
+    """Everything that renders a professional, including service availability"""
+    return [
+        professional_tag(professional.id),
+        PROFESSIONALS_LIST,
+        service_tag(professional.service_id),
+        SERVICES_LIST,
+    ]
+
+
+def tag_versions(tags):
+    """Current version token of each tag, creating any that don't exist yet"""
+    keys = [TAG_KEY.format(tag) for tag in tags]
+    versions = cache.get_many(*keys)
+
+    if any(version is None for version in versions):
+        for key, version in zip(keys, versions):
+            if version is None:
+                # add() keeps whichever token another worker may have just written
+                cache.add(key, uuid.uuid4().hex[:12], timeout=0)
+        versions = cache.get_many(*keys)
+
+    return versions
+
+
+def invalidate(*tags):
+    """Make every cached entry that declared one of these tags unreachable"""
+    cache.set_many({TAG_KEY.format(tag): uuid.uuid4().hex[:12] for tag in tags}, timeout=0)
+
+
+def _args_digest():
+    args = sorted((key, value) for key, value in request.args.items(multi=True))
+    return hashlib.md5(repr(args).encode()).hexdigest()
+
+
+def make_view_key(key_prefix, tags, query_string=False):
+    parts = [key_prefix or request.path]
+    if query_string:
+        parts.append(_args_digest())
+    parts.extend(tag_versions(tags))
+    return 'view:' + ':'.join(parts)
+
+
+def make_etag(tags):
+    """
+    Strong validator for the current request: changes when a tag version does, and at the latest
+    every HTTP_ETAG_MAX_AGE seconds, so a write that never invalidated its tags can't keep
+    clients on a stale representation.
+    """
+    max_age = current_app.config.get('HTTP_ETAG_MAX_AGE', 300)
+    parts = [request.path, _args_digest(), *tag_versions(tags)]
+    if max_age:
+        parts.append(str(int(time.time() // max_age)))
+    return hashlib.sha1(':'.join(parts).encode()).hexdigest()
+
+
+def _cache_control():
+    max_age = current_app.config.get('HTTP_CACHE_MAX_AGE', 0)
+    return f'public, max-age={max_age}, must-revalidate'
+
+
+def tag_names(tags, kwargs):
+    return tags(**kwargs) if callable(tags) else tags
+
+
+def _should_refresh(entry, now):
+    """Probabilistic early expiry (XFetch): slow-to-compute entries refresh a little before they expire"""
+    return now - entry['delta'] * EARLY_REFRESH_BETA * math.log(random.random() or 1e-12) >= entry['expires']
+
+
+def single_flight(cache_key, compute, timeout=None):
+    """
+    Return the cached value for cache_key, recomputing it in at most one worker at a time.
+
+    Entries carry a soft expiry and are stored for twice the timeout, so while one worker
+    holds the short lock and recomputes, the others keep serving the stale value. With
+    nothing cached at all, they wait briefly for the winner instead of piling onto the DB.
+    """
+    timeout = timeout or current_app.config.get('CACHE_DEFAULT_TIMEOUT', 300)
+    lock_key = LOCK_KEY.format(cache_key)
+    deadline = time.monotonic() + LOCK_WAIT
+
+    while True:
+        entry = cache.get(cache_key)
+        now = time.time()
+
+        if entry is not None and not _should_refresh(entry, now):
+            return entry['value']
+
+        if cache.add(lock_key, 1, timeout=LOCK_TIMEOUT):
+            try:
+                started = time.time()
+                value = compute()
+                finished = time.time()
+                cache.set(cache_key, {
+                    'value': value,
+                    'expires': finished + timeout,
+                    'delta': finished - started,
+                }, timeout=timeout * 2)
+                return value
+            finally:
+                cache.delete(lock_key)
+
+        if entry is not None:
+            return entry['value']
+
+        if time.monotonic() >= deadline:
+            return compute()
+        time.sleep(LOCK_POLL_INTERVAL)
+
+
+def cached(tags, timeout=None, key_prefix=None, query_string=False):
+    """
+    Cache a view like cache.cached, but key the entry by the versions of its tags.
+
+    `tags` is a list of tag names or a callable receiving the view kwargs. A write calls
+    invalidate() on the tags it affects instead of clearing the whole cache. Expiry is
+    single-flight with probabilistic early refresh, so a popular key expiring doesn't
+    send every concurrent request to the database.
+    """
+
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            cache_key = make_view_key(key_prefix, tag_names(tags, kwargs), query_string)
+            return single_flight(cache_key, lambda: fn(*args, **kwargs), timeout)
+
+        return wrapper
+    return decorator
+
+
+def conditional(tags):
+    """
+    Answer If-None-Match on a public GET with 304 before the view runs.
+
+    The ETag is built from the same tag versions as the server-side cache, so anything
+    that calls invalidate() on a tag also changes the ETag of every view declaring it.
+    It also rolls over every HTTP_ETAG_MAX_AGE seconds, for views with no server TTL behind them.
+    """
+
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            etag = make_etag(tag_names(tags, kwargs))
+            headers = {'ETag': f'"{etag}"', 'Cache-Control': _cache_control()}
+
+            if request.if_none_match.contains(etag):
+                return Response(status=304, headers=headers)
+
+            data, code = fn(*args, **kwargs)
+            if code != 200:
+                return data, code
+            return data, code, headers
+
+        return wrapper
+    return decorator
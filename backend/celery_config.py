@@ -10,7 +10,7 @@ def create_celery_app(app=None):
         app.import_name,
         broker = 'redis://localhost:6379/0',
         backend = 'redis://localhost:6379/0',
-        include=['tasks.reminder_tasks', 'tasks.report_tasks', 'tasks.export_tasks', 'tasks.service_tasks' ]
+        include=['tasks.reminder_tasks', 'tasks.report_tasks', 'tasks.export_tasks', 'tasks.service_tasks', 'tasks.stats_tasks', 'tasks.notification_tasks', 'tasks.mail_tasks' ]
     )
 
     celery.conf.update(
@@ -22,6 +22,11 @@ def create_celery_app(app=None):
         broker_pool_limit=None,
         broker_heartbeat=10,
         broker_connection_timeout=30,
+        # Outbox delivery runs on its own worker (celery worker -Q mail), so slow SMTP never
+        # holds up the default queue
+        task_routes={
+            'tasks.mail_tasks.*': {'queue': 'mail'},
+        },
         beat_schedule= {
             'send_daily_reminders': {
                 'task':'tasks.reminder_tasks.send_daily_reminders',
@@ -38,6 +43,24 @@ def create_celery_app(app=None):
             'auto_cancel_expired_requests': {
                 'task': 'tasks.service_tasks.auto_cancel_expired_requests',
                 'schedule': crontab(minute='*/10'),
+            },
+            'reconcile_dashboard_stats': {
+                'task': 'tasks.stats_tasks.reconcile_dashboard_stats',
+                'schedule': crontab(minute='*/15'),
+            },
+            'archive_old_notifications': {
+                'task': 'tasks.notification_tasks.archive_old_notifications',
+                'schedule': crontab(hour=3, minute=0),
+            },
+            'drain_outbox': {
+                'task': 'tasks.mail_tasks.drain_outbox',
+                'schedule': 30.0,
+                # A run that hasn't started within a minute is superseded by the next one
+                'options': {'expires': 60},
+            },
+            'purge_sent_outbox': {
+                'task': 'tasks.mail_tasks.purge_sent_outbox',
+                'schedule': crontab(hour=4, minute=0),
             }
         }
     )
@@ -0,0 +1,101 @@
+import click
+from datetime import datetime
+from flask.cli import with_appcontext
+from sqlalchemy import text
+from extensions import db
+from caching import invalidate, professional_tag, PROFESSIONALS_LIST
+from models import Professional, ServiceRequest, RejectedServiceRequest, Notification
+
+# Plan fragments that mean the planner is reading through an index (SQLite / PostgreSQL)
+INDEX_PLAN_MARKERS = ('USING INDEX', 'USING COVERING INDEX', 'USING INTEGER PRIMARY KEY',
+                      'Index Scan', 'Index Only Scan', 'Bitmap Index Scan')
+
+
+@click.command('repair-ratings')
+@click.option('--professional-id', 'professional_ids', type=int, multiple=True,
+              help="Only repair these professionals (repeatable). Defaults to all.")
+@with_appcontext
+def repair_ratings(professional_ids):
+    """Backfill or repair the denormalized professional rating aggregates."""
+    updated = Professional.refresh_rating_stats(list(professional_ids) or None)
+    # Cached profiles and their ETags only change when their tags are invalidated
+    ids = professional_ids or [pid for (pid,) in db.session.query(Professional.id)]
+    invalidate(*[professional_tag(pid) for pid in ids], PROFESSIONALS_LIST)
+    click.echo(f"Recomputed ratings for {updated} professionals")
+
+
+def _hot_queries():
+    """Representative statements for each hot endpoint/task query shape"""
+    now = datetime.utcnow()
+    rejected = RejectedServiceRequest.query.filter(
+        RejectedServiceRequest.service_request_id == ServiceRequest.id,
+        RejectedServiceRequest.professional_id == 1
+    ).exists()
+
+    return [
+        ('customer requests', ServiceRequest.query
+            .filter_by(customer_id=1)
+            .order_by(ServiceRequest.request_date.desc())),
+        ('professional requests by status', ServiceRequest.query
+            .filter_by(professional_id=1, status='assigned')),
+        ('available requests feed', ServiceRequest.query
+            .filter(ServiceRequest.service_id == 1,
+                    ServiceRequest.status == 'requested',
+                    ServiceRequest.professional_id.is_(None),
+                    ~rejected)
+            .order_by(ServiceRequest.request_date.desc())),
+        ('auto-cancel expired requests', ServiceRequest.query
+            .filter(ServiceRequest.status == 'requested',
+                    ServiceRequest.professional_id.is_(None),
+                    ServiceRequest.scheduled_date < now)),
+        ('overdue requests', ServiceRequest.query
+            .filter(ServiceRequest.status == 'assigned',
+                    ServiceRequest.scheduled_date < now)),
+        ('user notifications', Notification.query
+            .filter_by(user_id=1)
+            .order_by(Notification.created_at.desc())),
+        ('unread notifications', Notification.query
+            .filter_by(user_id=1, is_read=False)),
+        ('existing rejection', RejectedServiceRequest.query
+            .filter_by(service_request_id=1, professional_id=1)),
+    ]
+
+
+def _explain(query):
+    dialect = db.engine.dialect
+    sql = str(query.statement.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+
+    if dialect.name == 'sqlite':
+        rows = db.session.execute(text('EXPLAIN QUERY PLAN ' + sql)).all()
+        return '\n'.join(row[-1] for row in rows)
+
+    # Tiny tables make PostgreSQL prefer sequential scans; we only want to know an index is usable
+    db.session.execute(text('SET LOCAL enable_seqscan = off'))
+    rows = db.session.execute(text('EXPLAIN ' + sql)).all()
+    return '\n'.join(row[0] for row in rows)
+
+
+@click.command('explain-queries')
+@click.option('--verbose', '-v', is_flag=True, help="Print the full query plans.")
+@with_appcontext
+def explain_queries(verbose):
+    """Check that every hot query shape is served by an index."""
+    missing = []
+    for name, query in _hot_queries():
+        plan = _explain(query)
+        uses_index = any(marker in plan for marker in INDEX_PLAN_MARKERS)
+        click.echo(f"{'ok     ' if uses_index else 'NO INDEX'}  {name}")
+        if verbose or not uses_index:
+            click.echo('    ' + plan.replace('\n', '\n    '))
+        if not uses_index:
+            missing.append(name)
+    db.session.rollback()
+
+    if missing:
+        raise SystemExit(1)
+
+
+def register_commands(app):
+    """Register the maintenance CLI commands with the Flask app"""
+    app.cli.add_command(repair_ratings)
+    app.cli.add_command(explain_queries)
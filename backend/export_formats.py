@@ -0,0 +1,185 @@
+import csv
+import gzip
+import json
+import shutil
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet exports are optional
+    pa = pq = None
+
+# Order of the columns produced by tasks.export_tasks.service_request_rows
+COLUMNS = [
+    'id', 'customer', 'service', 'professional',
+    'request_date', 'scheduled_date', 'completion_date',
+    'status', 'price', 'remarks'
+]
+
+CSV_HEADER = [
+    'ID', 'Customer', 'Service', 'Professional',
+    'Request Date', 'Scheduled Date', 'Completion Date',
+    'Status', 'Price', 'Remarks'
+]
+
+# Rows buffered into each Parquet row group; small groups make the file slow to scan
+PARQUET_ROW_GROUP_SIZE = 100000
+
+
+def _open_text(filepath, compress, mode='w'):
+    if compress:
+        return gzip.open(filepath, mode + 't', newline='')
+    return open(filepath, mode, newline='')
+
+
+def _date(value):
+    return value.date().isoformat() if value else "N/A"
+
+
+def _append_parts(filepath, parts):
+    # Gzip members can be concatenated, so compressed parts are appended byte for byte too
+    with open(filepath, 'ab') as output:
+        for part in parts:
+            with open(part, 'rb') as source:
+                shutil.copyfileobj(source, output)
+
+
+class CsvWriter:
+    """The original export layout: one row per request, dates as YYYY-MM-DD"""
+
+    extension = 'csv'
+    content_type = 'text/csv'
+    compressible = True
+
+    def __init__(self, filepath, compress=False, header=True):
+        self.file = _open_text(filepath, compress)
+        self.writer = csv.writer(self.file)
+        if header:
+            self.writer.writerow(CSV_HEADER)
+
+    def write(self, rows):
+        self.writer.writerows(self.format_row(row) for row in rows)
+
+    @staticmethod
+    def format_row(row):
+        id, customer, service, professional, requested, scheduled, completed, status, price, remarks = row
+        return (
+            id,
+            customer,
+            service,
+            professional or "Not Assigned",
+            _date(requested),
+            _date(scheduled),
+            _date(completed),
+            status,
+            price,
+            remarks or "None"
+        )
+
+    def close(self):
+        self.file.close()
+
+    @classmethod
+    def assemble(cls, filepath, parts, compress=False):
+        """Write the header, then the headerless shard files in order"""
+        cls(filepath, compress).close()
+        _append_parts(filepath, parts)
+
+
+class NdjsonWriter:
+    """One JSON object per line, with full ISO timestamps and nulls for missing values"""
+
+    extension = 'ndjson'
+    content_type = 'application/x-ndjson'
+    compressible = True
+
+    def __init__(self, filepath, compress=False, header=True):
+        self.file = _open_text(filepath, compress)
+
+    def write(self, rows):
+        self.file.writelines(json.dumps(self.format_row(row)) + '\n' for row in rows)
+
+    @staticmethod
+    def format_row(row):
+        record = dict(zip(COLUMNS, row))
+        for field in ('request_date', 'scheduled_date', 'completion_date'):
+            if record[field] is not None:
+                record[field] = record[field].isoformat()
+        return record
+
+    def close(self):
+        self.file.close()
+
+    @classmethod
+    def assemble(cls, filepath, parts, compress=False):
+        open(filepath, 'wb').close()
+        _append_parts(filepath, parts)
+
+
+class ParquetWriter:
+    """Typed columns (int64 ids, timestamps, float64 price) in zstd-compressed row groups"""
+
+    extension = 'parquet'
+    content_type = 'application/vnd.apache.parquet'
+    # Compressed internally, per column chunk
+    compressible = False
+
+    def __init__(self, filepath, compress=False, header=True):
+        self.writer = pq.ParquetWriter(filepath, self.schema(), compression='zstd')
+        self.buffer = []
+
+    @staticmethod
+    def schema():
+        return pa.schema([
+            ('id', pa.int64()),
+            ('customer', pa.string()),
+            ('service', pa.string()),
+            ('professional', pa.string()),
+            ('request_date', pa.timestamp('us')),
+            ('scheduled_date', pa.timestamp('us')),
+            ('completion_date', pa.timestamp('us')),
+            ('status', pa.string()),
+            ('price', pa.float64()),
+            ('remarks', pa.string()),
+        ])
+
+    def write(self, rows):
+        self.buffer.extend(rows)
+        if len(self.buffer) >= PARQUET_ROW_GROUP_SIZE:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        columns = list(zip(*self.buffer))
+        schema = self.schema()
+        batch = pa.RecordBatch.from_arrays(
+            [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+            schema=schema
+        )
+        self.writer.write_batch(batch, row_group_size=len(self.buffer))
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+    @classmethod
+    def assemble(cls, filepath, parts, compress=False):
+        """Copy the shards' row groups into one file, one row group in memory at a time"""
+        with pq.ParquetWriter(filepath, cls.schema(), compression='zstd') as writer:
+            for part in parts:
+                source = pq.ParquetFile(part)
+                for index in range(source.num_row_groups):
+                    writer.write_table(source.read_row_group(index))
+
+
+EXPORT_FORMATS = {
+    'csv': CsvWriter,
+    'ndjson': NdjsonWriter,
+    'parquet': ParquetWriter,
+}
+
+
+def available_formats():
+    return [name for name in EXPORT_FORMATS if name != 'parquet' or pq is not None]
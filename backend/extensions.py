@@ -1,7 +1,28 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager
 from flask_caching import Cache
+import redis
 
 db = SQLAlchemy()
 jwt = JWTManager()
-cache = Cache()
\ No newline at end of file
+cache = Cache()
+
+
+class RedisClient:
+    """Shared redis-py client, configured from REDIS_URL when the app is created"""
+
+    def __init__(self, name='redis'):
+        self._client = None
+        self.name = name
+
+    def init_app(self, app, **options):
+        self._client = redis.Redis.from_url(app.config['REDIS_URL'], decode_responses=True, **options)
+        app.extensions[self.name] = self
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+redis_client = RedisClient()
+# Each open notification stream holds a connection for minutes, so they get their own pool
+stream_redis_client = RedisClient('redis_streams')
@@ -1,4 +1,17 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from email.utils import formataddr
+from functools import partial
+import json
+import smtplib
+import time
+import uuid
+from flask import current_app
 from flask_mail import Mail, Message
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from extensions import db
+from models import OutboxEmail
 
 # Initialize Flask-Mail
 mail = Mail()
@@ -11,7 +24,172 @@ def init_mail(app):
         MAIL_USE_TLS=app.config.get('MAIL_USE_TLS', False),
         MAIL_USERNAME=app.config.get('MAIL_USERNAME', None),
         MAIL_PASSWORD=app.config.get('MAIL_PASSWORD', None),
-        MAIL_DEFAULT_SENDER=app.config.get('MAIL_DEFAULT_SENDER', 'noreply@servicesphere.com')
+        MAIL_DEFAULT_SENDER=app.config.get('MAIL_DEFAULT_SENDER', 'noreply@servicesphere.com'),
+        # Messages sent over one SMTP connection, and connections open at once, per send_messages call
+        MAIL_BATCH_SIZE=app.config.get('MAIL_BATCH_SIZE', 50),
+        MAIL_MAX_CONNECTIONS=app.config.get('MAIL_MAX_CONNECTIONS', 4),
+        # Transient failures (connection drops, 4xx replies) are retried after 1s, 2s, 4s
+        MAIL_SEND_RETRIES=app.config.get('MAIL_SEND_RETRIES', 3),
+        MAIL_RETRY_BACKOFF=app.config.get('MAIL_RETRY_BACKOFF', 1.0),
+        # Outbox rows claimed per batch by drain_outbox, and batches per run
+        MAIL_OUTBOX_BATCH_SIZE=app.config.get('MAIL_OUTBOX_BATCH_SIZE', 500),
+        MAIL_OUTBOX_MAX_BATCHES=app.config.get('MAIL_OUTBOX_MAX_BATCHES', 20),
+        # Undelivered rows are retried after 1, 2, 4, ... minutes, then marked failed
+        MAIL_OUTBOX_MAX_ATTEMPTS=app.config.get('MAIL_OUTBOX_MAX_ATTEMPTS', 8),
+        MAIL_OUTBOX_RETRY_DELAY=app.config.get('MAIL_OUTBOX_RETRY_DELAY', 60),
+        # A claim older than this belongs to a worker that died mid-batch
+        MAIL_OUTBOX_CLAIM_TIMEOUT=app.config.get('MAIL_OUTBOX_CLAIM_TIMEOUT', 900),
+        # Sent rows (and so their idempotency keys) are kept this long
+        MAIL_OUTBOX_RETENTION_DAYS=app.config.get('MAIL_OUTBOX_RETENTION_DAYS', 30)
     )
     mail.init_app(app)
-    return mail
\ No newline at end of file
+    return mail
+
+
+def is_permanent_error(error):
+    """Rejections of one message (raised by connection.send) that will fail the same way on every attempt"""
+    if isinstance(error, (smtplib.SMTPAuthenticationError, smtplib.SMTPConnectError, smtplib.SMTPHeloError)):
+        # Connection.send can log in again mid-batch; that is the connection failing, not the message
+        return False
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return True
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code >= 500
+    return not isinstance(error, (smtplib.SMTPException, OSError))
+
+
+def _send_batch(app, messages):
+    """
+    Send messages in order over one connection, reconnecting after a transient failure.
+    Returns [(message, error, permanent)] for the messages that could not be delivered.
+
+    Only an error raised while sending a message can be blamed on that message. Failing to
+    connect, greet or log in is retried with backoff and then fails the rest of the batch as
+    transient, so a bad password or an unreachable server never marks messages undeliverable.
+    """
+    retries = app.config.get('MAIL_SEND_RETRIES', 3)
+    backoff = app.config.get('MAIL_RETRY_BACKOFF', 1.0)
+    pending = list(reversed(messages))
+    failures = []
+    attempt = 0
+
+    with app.app_context():
+        while pending:
+            try:
+                with mail.connect() as connection:
+                    while pending:
+                        message = pending[-1]
+                        try:
+                            connection.send(message)
+                        except Exception as e:
+                            if not is_permanent_error(e):
+                                raise
+                            # smtplib resets the transaction after a refusal, so the connection stays usable
+                            failures.append((pending.pop(), e, True))
+                            app.logger.error(f"Failed to send email to {', '.join(message.send_to)}: {str(e)}")
+                        else:
+                            pending.pop()
+                        attempt = 0
+
+            except Exception as e:
+                if not pending:
+                    # Everything was handed over; only closing the connection failed
+                    break
+                attempt += 1
+                if attempt > retries:
+                    # The server is still unreachable; don't wait out the retries again for every message
+                    failures.extend((message, e, False) for message in reversed(pending))
+                    app.logger.error(f"Failed to send {len(pending)} emails after {retries} retries: {str(e)}")
+                    pending = []
+                else:
+                    app.logger.warning(f"SMTP error, retrying in {backoff * 2 ** (attempt - 1)}s: {str(e)}")
+                    time.sleep(backoff * 2 ** (attempt - 1))
+
+    return failures
+
+
+def send_messages(messages):
+    """
+    Send many messages, MAIL_BATCH_SIZE per SMTP connection (instead of a connect/quit per
+    message as mail.send does), with up to MAIL_MAX_CONNECTIONS batches in flight at once.
+    Returns [(message, error, permanent)] for the messages that could not be delivered;
+    permanent is False when the error may clear on a later attempt.
+    """
+    if not messages:
+        return []
+
+    app = current_app._get_current_object()
+    batch_size = app.config.get('MAIL_BATCH_SIZE', 50)
+    batches = [messages[start:start + batch_size] for start in range(0, len(messages), batch_size)]
+
+    if len(batches) == 1:
+        return _send_batch(app, batches[0])
+
+    with ThreadPoolExecutor(max_workers=min(app.config.get('MAIL_MAX_CONNECTIONS', 4), len(batches))) as pool:
+        return [failure for failures in pool.map(partial(_send_batch, app), batches) for failure in failures]
+
+
+def send_message(message):
+    """Send one message with the same retry and backoff as send_messages; True if it was delivered"""
+    return not send_messages([message])
+
+
+def _outbox_row(message, idempotency_key, now):
+    return {
+        'idempotency_key': idempotency_key or uuid.uuid4().hex,
+        'sender': formataddr(message.sender) if isinstance(message.sender, tuple) else message.sender,
+        'recipients': json.dumps(list(message.recipients)),
+        'subject': message.subject,
+        'body': message.body,
+        'html': message.html,
+        'status': 'pending',
+        'attempts': 0,
+        'next_attempt_at': now,
+        'created_at': now
+    }
+
+
+def enqueue_emails(entries):
+    """
+    Queue (message, idempotency_key) pairs in the outbox for drain_outbox to deliver, in one
+    insert and one commit. A key that is already queued (or was sent within
+    MAIL_OUTBOX_RETENTION_DAYS) is skipped; a None key never collides.
+    Returns the number of messages newly queued.
+    """
+    now = datetime.utcnow()
+    rows = {}
+    for message, idempotency_key in entries:
+        row = _outbox_row(message, idempotency_key, now)
+        rows.setdefault(row['idempotency_key'], row)
+    if not rows:
+        return 0
+
+    existing = set(db.session.scalars(
+        select(OutboxEmail.idempotency_key).where(OutboxEmail.idempotency_key.in_(list(rows)))
+    ))
+    new_rows = [row for key, row in rows.items() if key not in existing]
+    if not new_rows:
+        return 0
+
+    try:
+        db.session.execute(insert(OutboxEmail), new_rows)
+        db.session.commit()
+        return len(new_rows)
+    except IntegrityError:
+        # Another producer queued some of the same keys in the meantime; insert one at a time
+        db.session.rollback()
+
+    queued = 0
+    for row in new_rows:
+        try:
+            db.session.execute(insert(OutboxEmail), [row])
+            db.session.commit()
+            queued += 1
+        except IntegrityError:
+            db.session.rollback()
+    return queued
+
+
+def enqueue_email(message, idempotency_key=None):
+    """Queue one message in the outbox; False if its idempotency key was already queued"""
+    return enqueue_emails([(message, idempotency_key)]) == 1
@@ -0,0 +1,42 @@
+"""add professional rating aggregates
+
+Revision ID: 3f1c2a9d8b01
+Revises: 
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a9d8b01'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _columns(table):
+    return {column['name'] for column in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def upgrade():
+    # create_app() runs db.create_all(), so a fresh database may already have these
+    existing = _columns('professionals')
+    with op.batch_alter_table('professionals', schema=None) as batch_op:
+        if 'rating_sum' not in existing:
+            batch_op.add_column(sa.Column('rating_sum', sa.Integer(), nullable=False, server_default='0'))
+        if 'rating_count' not in existing:
+            batch_op.add_column(sa.Column('rating_count', sa.Integer(), nullable=False, server_default='0'))
+
+    op.execute("""
+        UPDATE professionals SET
+            rating_sum = (SELECT COALESCE(SUM(rating), 0) FROM reviews WHERE reviews.professional_id = professionals.id),
+            rating_count = (SELECT COUNT(id) FROM reviews WHERE reviews.professional_id = professionals.id)
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('professionals', schema=None) as batch_op:
+        batch_op.drop_column('rating_count')
+        batch_op.drop_column('rating_sum')
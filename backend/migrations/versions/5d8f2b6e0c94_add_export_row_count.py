@@ -0,0 +1,30 @@
+"""add export row count
+
+Revision ID: 5d8f2b6e0c94
+Revises: c52b7e91a4d3
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d8f2b6e0c94'
+down_revision = 'c52b7e91a4d3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('export_tasks')}
+
+    # create_app() runs db.create_all(), which doesn't add columns to existing tables
+    if 'row_count' not in columns:
+        with op.batch_alter_table('export_tasks', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('row_count', sa.Integer(), server_default='0', nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('export_tasks', schema=None) as batch_op:
+        batch_op.drop_column('row_count')
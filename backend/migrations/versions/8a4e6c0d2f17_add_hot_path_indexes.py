@@ -0,0 +1,59 @@
+"""add hot path indexes
+
+Revision ID: 8a4e6c0d2f17
+Revises: 3f1c2a9d8b01
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8a4e6c0d2f17'
+down_revision = '3f1c2a9d8b01'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('idx_service_request_customer_date', 'service_requests', ['customer_id', 'request_date'], {}),
+    ('idx_service_request_professional_status', 'service_requests', ['professional_id', 'status'], {}),
+    ('idx_service_request_status_scheduled', 'service_requests', ['status', 'scheduled_date'], {}),
+    ('idx_service_request_available', 'service_requests', ['service_id', 'status', 'request_date'], {
+        'postgresql_where': sa.text('professional_id IS NULL'),
+        'sqlite_where': sa.text('professional_id IS NULL'),
+    }),
+    ('idx_notification_user_read_created', 'notifications', ['user_id', 'is_read', 'created_at'], {}),
+    ('uq_rejected_professional_request', 'rejected_service_requests', ['professional_id', 'service_request_id'], {
+        'unique': True,
+    }),
+]
+
+
+def _index_names(table):
+    return {index['name'] for index in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def upgrade():
+    # Keep the earliest rejection per (professional, request) so the unique index can be built
+    op.execute("""
+        DELETE FROM rejected_service_requests
+        WHERE id NOT IN (
+            SELECT keep_id FROM (
+                SELECT MIN(id) AS keep_id
+                FROM rejected_service_requests
+                GROUP BY professional_id, service_request_id
+            ) AS earliest
+        )
+    """)
+
+    for name, table, columns, kwargs in INDEXES:
+        # create_app() runs db.create_all(), so a fresh database may already have these
+        if name not in _index_names(table):
+            op.create_index(name, table, columns, **kwargs)
+
+
+def downgrade():
+    for name, table, columns, kwargs in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
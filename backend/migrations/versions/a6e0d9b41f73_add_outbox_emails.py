@@ -0,0 +1,49 @@
+"""add outbox emails
+
+Revision ID: a6e0d9b41f73
+Revises: f3a8c2d71e46
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6e0d9b41f73'
+down_revision = 'f3a8c2d71e46'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # create_app() runs db.create_all(), so a fresh database may already have this
+    if 'outbox_emails' not in sa.inspect(op.get_bind()).get_table_names():
+        op.create_table(
+            'outbox_emails',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('idempotency_key', sa.String(length=255), nullable=False),
+            sa.Column('sender', sa.String(length=255), nullable=True),
+            sa.Column('recipients', sa.Text(), nullable=False),
+            sa.Column('subject', sa.String(length=255), nullable=False),
+            sa.Column('body', sa.Text(), nullable=True),
+            sa.Column('html', sa.Text(), nullable=True),
+            sa.Column('status', sa.String(length=20), nullable=True),
+            sa.Column('attempts', sa.Integer(), nullable=True),
+            sa.Column('last_error', sa.Text(), nullable=True),
+            sa.Column('next_attempt_at', sa.DateTime(), nullable=True),
+            sa.Column('claim_token', sa.String(length=32), nullable=True),
+            sa.Column('claimed_at', sa.DateTime(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('sent_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('idempotency_key')
+        )
+        op.create_index('ix_outbox_emails_claim_token', 'outbox_emails', ['claim_token'])
+        op.create_index('idx_outbox_status_next_attempt', 'outbox_emails', ['status', 'next_attempt_at'])
+
+
+def downgrade():
+    op.drop_index('idx_outbox_status_next_attempt', table_name='outbox_emails')
+    op.drop_index('ix_outbox_emails_claim_token', table_name='outbox_emails')
+    op.drop_table('outbox_emails')
@@ -0,0 +1,45 @@
+"""add export delta watermark
+
+Revision ID: b94d1e6a7c30
+Revises: e7a3c1f95b28
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b94d1e6a7c30'
+down_revision = 'e7a3c1f95b28'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    columns = {column['name'] for column in inspector.get_columns('export_tasks')}
+    indexes = {index['name'] for index in inspector.get_indexes('service_requests')}
+
+    # create_app() runs db.create_all(), which doesn't add columns to existing tables
+    with op.batch_alter_table('export_tasks', schema=None) as batch_op:
+        if 'mode' not in columns:
+            batch_op.add_column(sa.Column('mode', sa.String(length=10), server_default='full', nullable=True))
+        if 'delta_since' not in columns:
+            batch_op.add_column(sa.Column('delta_since', sa.DateTime(), nullable=True))
+        if 'watermark' not in columns:
+            batch_op.add_column(sa.Column('watermark', sa.DateTime(), nullable=True))
+
+    if 'idx_service_request_last_updated' not in indexes:
+        with op.batch_alter_table('service_requests', schema=None) as batch_op:
+            batch_op.create_index('idx_service_request_last_updated', ['last_updated'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('service_requests', schema=None) as batch_op:
+        batch_op.drop_index('idx_service_request_last_updated')
+
+    with op.batch_alter_table('export_tasks', schema=None) as batch_op:
+        batch_op.drop_column('watermark')
+        batch_op.drop_column('delta_since')
+        batch_op.drop_column('mode')
@@ -0,0 +1,45 @@
+"""add notification archive
+
+Revision ID: c52b7e91a4d3
+Revises: 8a4e6c0d2f17
+Create Date: 2026-10-18 12:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c52b7e91a4d3'
+down_revision = '8a4e6c0d2f17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+
+    # create_app() runs db.create_all(), so a fresh database may already have these
+    if 'notifications_archive' not in inspector.get_table_names():
+        op.create_table(
+            'notifications_archive',
+            sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('type', sa.String(length=50), nullable=False),
+            sa.Column('message', sa.Text(), nullable=False),
+            sa.Column('is_read', sa.Boolean(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('archived_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_notifications_archive_user_id', 'notifications_archive', ['user_id'])
+
+    if 'idx_notification_read_created' not in {index['name'] for index in inspector.get_indexes('notifications')}:
+        op.create_index('idx_notification_read_created', 'notifications', ['is_read', 'created_at'])
+
+
+def downgrade():
+    op.drop_index('idx_notification_read_created', table_name='notifications')
+    op.drop_index('ix_notifications_archive_user_id', table_name='notifications_archive')
+    op.drop_table('notifications_archive')
@@ -0,0 +1,30 @@
+"""add report run already queued count
+
+Revision ID: d1b7f04c9e52
+Revises: a6e0d9b41f73
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd1b7f04c9e52'
+down_revision = 'a6e0d9b41f73'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('report_runs')}
+
+    # create_app() runs db.create_all(), which doesn't add columns to existing tables
+    if 'already_queued' not in columns:
+        with op.batch_alter_table('report_runs', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('already_queued', sa.Integer(), server_default='0', nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('report_runs', schema=None) as batch_op:
+        batch_op.drop_column('already_queued')
@@ -0,0 +1,30 @@
+"""add export format
+
+Revision ID: e7a3c1f95b28
+Revises: 5d8f2b6e0c94
+Create Date: 2026-10-18 13:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7a3c1f95b28'
+down_revision = '5d8f2b6e0c94'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('export_tasks')}
+
+    # create_app() runs db.create_all(), which doesn't add columns to existing tables
+    if 'format' not in columns:
+        with op.batch_alter_table('export_tasks', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('format', sa.String(length=20), server_default='csv', nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('export_tasks', schema=None) as batch_op:
+        batch_op.drop_column('format')
@@ -0,0 +1,40 @@
+"""add report runs
+
+Revision ID: f3a8c2d71e46
+Revises: b94d1e6a7c30
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a8c2d71e46'
+down_revision = 'b94d1e6a7c30'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # create_app() runs db.create_all(), so a fresh database may already have this
+    if 'report_runs' not in sa.inspect(op.get_bind()).get_table_names():
+        op.create_table(
+            'report_runs',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('report_type', sa.String(length=50), nullable=False),
+            sa.Column('period', sa.String(length=7), nullable=False),
+            sa.Column('status', sa.String(length=20), nullable=True),
+            sa.Column('chunks', sa.Integer(), nullable=True),
+            sa.Column('failed_chunks', sa.Integer(), nullable=True),
+            sa.Column('generated', sa.Integer(), nullable=True),
+            sa.Column('skipped', sa.Integer(), nullable=True),
+            sa.Column('failed', sa.Integer(), nullable=True),
+            sa.Column('started_at', sa.DateTime(), nullable=True),
+            sa.Column('completed_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('id')
+        )
+
+
+def downgrade():
+    op.drop_table('report_runs')
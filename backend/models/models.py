@@ -1,6 +1,10 @@
+import json
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import case, func, insert, select, update
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import joinedload, selectinload
 from extensions import db
 
 # db = SQLAlchemy()
@@ -16,7 +20,8 @@ class User(db.Model):
     phone = db.Column(db.String(20))
     name = db.Column(db.String(100))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    is_active = db.Column(db.Boolean, default=True)
+    # active_history: the dashboard counters need the previous value even when it was expired
+    is_active = db.mapped_column(db.Boolean, default=True, active_history=True)
     
     customer = db.relationship('Customer', backref='user', uselist=False, cascade="all, delete-orphan")
     professional = db.relationship('Professional', backref='user', uselist=False, cascade="all, delete-orphan")
@@ -146,10 +151,12 @@ class Professional(db.Model):
     service_id = db.Column(db.Integer, db.ForeignKey('services.id'), nullable=False)
     bio = db.Column(db.Text)
     years_experience = db.Column(db.Integer, default=0)
-    verification_status = db.Column(db.String(20), default='pending')  # 'pending', 'approved', 'rejected'
+    verification_status = db.mapped_column(db.String(20), default='pending', active_history=True)  # 'pending', 'approved', 'rejected'
     documents_url = db.Column(db.Text)  
     registered_on = db.Column(db.DateTime, default=datetime.utcnow)
     last_active = db.Column(db.DateTime, default=datetime.utcnow)
+    rating_sum = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     service_requests = db.relationship('ServiceRequest', backref='professional')
     rejected_requests = db.relationship('RejectedServiceRequest', backref='professional', cascade="all, delete-orphan")
@@ -163,11 +170,55 @@ class Professional(db.Model):
         db.session.delete(self)
         db.session.commit()
         
-    def get_average_rating(self):
-        if not self.reviews:
+    @hybrid_property
+    def average_rating(self):
+        if not self.rating_count:
             return 0
-        total = sum(review.rating for review in self.reviews)
-        return round(total / len(self.reviews), 1)
+        # Half-up to one decimal in integer arithmetic, exactly as the SQL expression does it,
+        # so filtering and sorting agree with the value to_dict returns
+        return (20 * self.rating_sum + self.rating_count) // (2 * self.rating_count) / 10
+
+    @average_rating.expression
+    def average_rating(cls):
+        return case(
+            (cls.rating_count > 0, ((20 * cls.rating_sum + cls.rating_count) // (2 * cls.rating_count)) / 10.0),
+            else_=0
+        )
+
+    def get_average_rating(self):
+        return self.average_rating
+
+    def add_rating(self, rating):
+        """Count a new review; the increment runs in SQL so concurrent writes don't race"""
+        self.rating_sum = Professional.rating_sum + rating
+        self.rating_count = Professional.rating_count + 1
+
+    def change_rating(self, old_rating, new_rating):
+        self.rating_sum = Professional.rating_sum + (new_rating - old_rating)
+
+    def remove_rating(self, rating):
+        self.rating_sum = Professional.rating_sum - rating
+        self.rating_count = Professional.rating_count - 1
+
+    @classmethod
+    def refresh_rating_stats(cls, professional_ids=None):
+        """Recompute rating_sum/rating_count from the reviews table"""
+        rating_sum = (
+            select(func.coalesce(func.sum(Review.rating), 0))
+            .where(Review.professional_id == cls.id)
+            .scalar_subquery()
+        )
+        rating_count = (
+            select(func.count(Review.id))
+            .where(Review.professional_id == cls.id)
+            .scalar_subquery()
+        )
+        stmt = update(cls).values(rating_sum=rating_sum, rating_count=rating_count)
+        if professional_ids is not None:
+            stmt = stmt.where(cls.id.in_(professional_ids))
+        result = db.session.execute(stmt.execution_options(synchronize_session=False))
+        db.session.commit()
+        return result.rowcount
     
     def to_dict(self):
         avg_rating = self.get_average_rating()
@@ -204,7 +255,8 @@ class ServiceRequest(db.Model):
     request_date = db.Column(db.DateTime, default=datetime.utcnow)
     scheduled_date = db.Column(db.DateTime, nullable=False)
     completion_date = db.Column(db.DateTime)
-    status = db.Column(db.String(20), default='requested')  # 'requested', 'assigned', 'completed', 'closed', 'cancelled'
+    # active_history: dashboard counters and status events need the previous status
+    status = db.mapped_column(db.String(20), default='requested', active_history=True)  # 'requested', 'assigned', 'completed', 'closed', 'cancelled'
     remarks = db.Column(db.Text)
     last_updated = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -216,6 +268,17 @@ class ServiceRequest(db.Model):
         db.CheckConstraint("status IN ('requested', 'assigned', 'in_progress', 'completed', 'closed', 'cancelled')"),
         db.Index('idx_service_request_status', 'status'),
         db.Index('idx_service_request_dates', 'request_date', 'completion_date'),
+        db.Index('idx_service_request_customer_date', 'customer_id', 'request_date'),
+        db.Index('idx_service_request_professional_status', 'professional_id', 'status'),
+        db.Index('idx_service_request_status_scheduled', 'status', 'scheduled_date'),
+        # Delta exports select the rows changed since the previous export's watermark
+        db.Index('idx_service_request_last_updated', 'last_updated'),
+        # Partial index for the "available requests" feed shown to professionals
+        db.Index(
+            'idx_service_request_available', 'service_id', 'status', 'request_date',
+            postgresql_where=db.text('professional_id IS NULL'),
+            sqlite_where=db.text('professional_id IS NULL')
+        ),
     )
     
     def save_to_db(self):
@@ -226,8 +289,22 @@ class ServiceRequest(db.Model):
         db.session.delete(self)
         db.session.commit()
         
+    @classmethod
+    def list_options(cls):
+        """Loader options that fetch everything to_dict touches in a fixed number of queries"""
+        return (
+            joinedload(cls.customer).joinedload(Customer.user),
+            joinedload(cls.service),
+            joinedload(cls.professional).joinedload(Professional.user),
+            selectinload(cls.reviews),
+        )
+
+    @classmethod
+    def to_dict_many(cls, service_requests):
+        """Serialize a list of requests loaded with list_options"""
+        return [req.to_dict() for req in service_requests]
+
     def to_dict(self):
-        review = Review.query.filter_by(service_request_id=self.id).first()
         return {
             'id': self.id,
             'customer_id': self.customer_id,
@@ -248,7 +325,7 @@ class ServiceRequest(db.Model):
             'status': self.status,
             'remarks': self.remarks,
             'last_updated': self.last_updated.isoformat() if self.last_updated else None,
-            'has_review': review is not None,
+            'has_review': len(self.reviews) > 0,
             'reviews': [review.to_dict() for review in self.reviews],
         }
 
@@ -262,6 +339,10 @@ class RejectedServiceRequest(db.Model):
     professional_id = db.Column(db.Integer, db.ForeignKey('professionals.id'), nullable=False)
     reason = db.Column(db.Text)
     rejected_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('uq_rejected_professional_request', 'professional_id', 'service_request_id', unique=True),
+    )
     
     def save_to_db(self):
         db.session.add(self)
@@ -330,12 +411,47 @@ class Notification(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     type = db.Column(db.String(50), nullable=False)  # 'request', 'approval', 'reminder', etc.
     message = db.Column(db.Text, nullable=False)
-    is_read = db.Column(db.Boolean, default=False)
+    is_read = db.mapped_column(db.Boolean, default=False, active_history=True)  # unread counters need the previous value
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('idx_notification_user_read_created', 'user_id', 'is_read', 'created_at'),
+        # Lets the retention job find old read rows without scanning every user's notifications
+        db.Index('idx_notification_read_created', 'is_read', 'created_at'),
+    )
     
     def save_to_db(self):
         db.session.add(self)
         db.session.commit()
+
+    @classmethod
+    def bulk_create(cls, user_ids, type, message):
+        """
+        Insert the same notification for many users in one statement and one commit.
+        Returns the created rows in to_dict() form.
+        """
+        user_ids = list(user_ids)
+        if not user_ids:
+            return []
+
+        created_at = datetime.utcnow()
+        rows = db.session.execute(insert(cls).returning(cls.id, cls.user_id), [
+            {'user_id': user_id, 'type': type, 'message': message, 'is_read': False, 'created_at': created_at}
+            for user_id in user_ids
+        ]).all()
+        db.session.commit()
+
+        return [
+            {
+                'id': id,
+                'user_id': user_id,
+                'type': type,
+                'message': message,
+                'is_read': False,
+                'created_at': created_at.isoformat()
+            }
+            for id, user_id in rows
+        ]
         
     def delete_from_db(self):
         db.session.delete(self)
@@ -352,6 +468,32 @@ class Notification(db.Model):
         }
 
 
+class NotificationArchive(db.Model):
+    """Read notifications moved out of the live table by the retention job"""
+
+    __tablename__ = 'notifications_archive'
+
+    # Same id as the notification it was moved from
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
+    type = db.Column(db.String(50), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    is_read = db.Column(db.Boolean, default=True)
+    created_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'type': self.type,
+            'message': self.message,
+            'is_read': self.is_read,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'archived_at': self.archived_at.isoformat() if self.archived_at else None
+        }
+
+
 class ExportTask(db.Model):
     
     __tablename__ = 'export_tasks'
@@ -359,8 +501,14 @@ class ExportTask(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     export_type = db.Column(db.String(50), nullable=False)  # 'service_requests', 'professionals', etc.
+    format = db.Column(db.String(20), default='csv', server_default='csv')  # 'csv', 'ndjson', 'parquet'
+    mode = db.Column(db.String(10), default='full', server_default='full')  # 'full', 'delta'
     status = db.Column(db.String(20), default='pending')  # 'pending', 'processing', 'completed', 'failed'
     file_path = db.Column(db.String(255))
+    row_count = db.Column(db.Integer, default=0, server_default='0')
+    # Rows with last_updated in [delta_since, watermark) are exported; delta_since is NULL for a full dump
+    delta_since = db.Column(db.DateTime)
+    watermark = db.Column(db.DateTime)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     completed_at = db.Column(db.DateTime)
     
@@ -377,9 +525,97 @@ class ExportTask(db.Model):
             'id': self.id,
             'user_id': self.user_id,
             'export_type': self.export_type,
+            'format': self.format,
+            'mode': self.mode,
             'status': self.status,
             'file_path': self.file_path,
+            'row_count': self.row_count,
+            'delta_since': self.delta_since.isoformat() if self.delta_since else None,
+            'watermark': self.watermark.isoformat() if self.watermark else None,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'completed_at': self.completed_at.isoformat() if self.completed_at else None
         }
 
+
+
+class ReportRun(db.Model):
+    
+    __tablename__ = 'report_runs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    report_type = db.Column(db.String(50), nullable=False)  # 'monthly_activity'
+    period = db.Column(db.String(7), nullable=False)  # 'YYYY-MM'
+    status = db.Column(db.String(20), default='processing')  # 'processing', 'completed', 'failed'
+    chunks = db.Column(db.Integer, default=0)
+    failed_chunks = db.Column(db.Integer, default=0)
+    generated = db.Column(db.Integer, default=0)
+    skipped = db.Column(db.Integer, default=0)
+    failed = db.Column(db.Integer, default=0)
+    already_queued = db.Column(db.Integer, default=0)  # reports an earlier run of the period had queued
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    completed_at = db.Column(db.DateTime)
+    
+    def save_to_db(self):
+        db.session.add(self)
+        db.session.commit()
+        
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'report_type': self.report_type,
+            'period': self.period,
+            'status': self.status,
+            'chunks': self.chunks,
+            'failed_chunks': self.failed_chunks,
+            'generated': self.generated,
+            'skipped': self.skipped,
+            'failed': self.failed,
+            'already_queued': self.already_queued,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None
+        }
+
+
+class OutboxEmail(db.Model):
+    """Outgoing email, queued by producers and delivered by the drain_outbox task"""
+    
+    __tablename__ = 'outbox_emails'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    idempotency_key = db.Column(db.String(255), nullable=False, unique=True)
+    sender = db.Column(db.String(255))
+    recipients = db.Column(db.Text, nullable=False)  # JSON list of addresses
+    subject = db.Column(db.String(255), nullable=False)
+    body = db.Column(db.Text)
+    html = db.Column(db.Text)
+    status = db.Column(db.String(20), default='pending')  # 'pending', 'sending', 'sent', 'failed'
+    attempts = db.Column(db.Integer, default=0)
+    last_error = db.Column(db.Text)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Set while a drain_outbox run owns the row; a stale claim is taken over after MAIL_OUTBOX_CLAIM_TIMEOUT
+    claim_token = db.Column(db.String(32), index=True)
+    claimed_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('idx_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+    
+    def save_to_db(self):
+        db.session.add(self)
+        db.session.commit()
+        
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'idempotency_key': self.idempotency_key,
+            'recipients': json.loads(self.recipients),
+            'subject': self.subject,
+            'status': self.status,
+            'attempts': self.attempts,
+            'last_error': self.last_error,
+            'next_attempt_at': self.next_attempt_at.isoformat() if self.next_attempt_at else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'sent_at': self.sent_at.isoformat() if self.sent_at else None
+        }
@@ -0,0 +1,206 @@
+from collections import Counter
+import json
+import time
+from flask import current_app
+from sqlalchemy import event, inspect
+import redis
+from extensions import db, redis_client
+from models import Notification, ServiceRequest
+
+UNREAD_KEY = 'notifications:unread:{}'
+STREAM_CHANNEL = 'notifications:stream:{}'
+# Longest backlog replayed on resume; beyond that the client is told to refetch instead
+STREAM_REPLAY_LIMIT = 100
+STREAM_RETRY_MS = 3000
+# Counters expire so a rebuild that raced a concurrent change can't stay wrong for long
+UNREAD_TTL = 3600
+
+# Adjust a counter only if it is already cached; a missing key is rebuilt from SQL on the next read.
+# A counter that would go negative has drifted, so it is dropped instead.
+INCR_IF_EXISTS = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return nil
+end
+local value = redis.call('INCRBY', KEYS[1], ARGV[1])
+if value < 0 then
+    redis.call('DEL', KEYS[1])
+    return nil
+end
+return value
+"""
+
+
+def _session_changes(session):
+    return session.info.setdefault('unread_delta', Counter()), session.info.setdefault('unread_reset', set())
+
+
+def unread_changed(user_id, amount):
+    """Record a change made outside the ORM unit of work (bulk insert/update), applied on commit"""
+    delta, _ = _session_changes(db.session)
+    delta[user_id] += amount
+
+
+def reset_unread_count(user_id):
+    """Drop the cached counter on commit when the change can't be counted cheaply (bulk delete)"""
+    _, reset = _session_changes(db.session)
+    reset.add(user_id)
+
+
+def _pending_events(session):
+    return session.info.setdefault('stream_events', [])
+
+
+def format_event(event, data, event_id=None):
+    """A Server-Sent Events frame"""
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+def _publish(pipe, user_id, event, data, event_id=None):
+    message = {'event': event, 'data': data, 'id': event_id}
+    pipe.publish(STREAM_CHANNEL.format(user_id), json.dumps(message))
+
+
+def publish_notifications(notifications):
+    """Push already committed notifications (in to_dict() form) to their users' streams"""
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for notification in notifications:
+            _publish(pipe, notification['user_id'], 'notification', notification, notification['id'])
+        pipe.execute()
+    except redis.RedisError as e:
+        current_app.logger.warning(f"Failed to publish notifications: {str(e)}")
+
+
+def stream_events(pubsub, backlog, last_event_id, heartbeat, duration):
+    """
+    Generate the frames of one notification stream from an already subscribed pubsub.
+
+    The stream ends after `duration` seconds; EventSource reconnects on its own with
+    Last-Event-ID, which keeps long-lived connections from pinning a worker forever.
+    """
+    try:
+        yield f'retry: {STREAM_RETRY_MS}\n\n'
+        for frame in backlog:
+            yield frame
+
+        deadline = time.monotonic() + duration
+        last_write = time.monotonic()
+        while time.monotonic() < deadline:
+            message = pubsub.get_message(timeout=heartbeat)
+            if message is None:
+                if time.monotonic() - last_write >= heartbeat:
+                    # Comment frame: keeps proxies from closing an idle connection
+                    yield ': keepalive\n\n'
+                    last_write = time.monotonic()
+                continue
+
+            payload = json.loads(message['data'])
+            if payload['id'] is not None and last_event_id is not None and payload['id'] <= last_event_id:
+                # Already sent as part of the backlog
+                continue
+            yield format_event(payload['event'], payload['data'], payload['id'])
+            last_write = time.monotonic()
+
+    except redis.RedisError as e:
+        current_app.logger.warning(f"Notification stream interrupted: {str(e)}")
+    finally:
+        pubsub.close()
+
+
+def _status_event(service_request, old_status):
+    data = {
+        'id': service_request.id,
+        'status': service_request.status,
+        'previous_status': old_status,
+    }
+    user_ids = [service_request.customer.user_id]
+    if service_request.professional is not None:
+        user_ids.append(service_request.professional.user_id)
+    return [(user_id, 'service_request', data, None) for user_id in user_ids]
+
+
+def _collect(session, flush_context):
+    delta, _ = _session_changes(session)
+    events = _pending_events(session)
+
+    for obj in session.new:
+        if isinstance(obj, Notification):
+            # Ids are assigned by now, so the event can serve as a resume cursor
+            events.append((obj.user_id, 'notification', obj.to_dict(), obj.id))
+            if not obj.is_read:
+                delta[obj.user_id] += 1
+
+    for obj in session.deleted:
+        if isinstance(obj, Notification) and not obj.is_read:
+            delta[obj.user_id] -= 1
+
+    for obj in session.dirty:
+        if isinstance(obj, Notification):
+            history = inspect(obj).attrs.is_read.history
+            if history.deleted and history.added and bool(history.deleted[0]) != bool(history.added[0]):
+                delta[obj.user_id] += -1 if history.added[0] else 1
+        elif isinstance(obj, ServiceRequest):
+            history = inspect(obj).attrs.status.history
+            if history.deleted and history.added and history.deleted[0] != history.added[0]:
+                events.extend(_status_event(obj, history.deleted[0]))
+
+
+def _apply(session):
+    delta = session.info.pop('unread_delta', None) or Counter()
+    reset = session.info.pop('unread_reset', None) or set()
+    events = session.info.pop('stream_events', None) or []
+    if not any(delta.values()) and not reset and not events:
+        return
+
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for user_id in reset:
+            pipe.delete(UNREAD_KEY.format(user_id))
+        for user_id, amount in delta.items():
+            if amount and user_id not in reset:
+                pipe.eval(INCR_IF_EXISTS, 1, UNREAD_KEY.format(user_id), amount)
+        for user_id, event, data, event_id in events:
+            _publish(pipe, user_id, event, data, event_id)
+        pipe.execute()
+    except redis.RedisError as e:
+        current_app.logger.warning(f"Failed to update unread counters or publish notifications: {str(e)}")
+
+
+def _discard(session, *args):
+    session.info.pop('unread_delta', None)
+    session.info.pop('unread_reset', None)
+    session.info.pop('stream_events', None)
+
+
+def count_unread(user_id):
+    return Notification.query.filter_by(user_id=user_id, is_read=False).count()
+
+
+def get_unread_count(user_id):
+    """Unread notifications of a user, from Redis when cached, otherwise counted and cached"""
+    key = UNREAD_KEY.format(user_id)
+    try:
+        count = redis_client.get(key)
+        if count is not None:
+            return int(count)
+
+        count = count_unread(user_id)
+        redis_client.set(key, count, ex=UNREAD_TTL, nx=True)
+        return count
+
+    except redis.RedisError as e:
+        current_app.logger.warning(f"Unread counter unavailable in Redis, counting in SQL: {str(e)}")
+        return count_unread(user_id)
+
+
+def init_notifications(app):
+    """Keep unread counters and live streams in step with committed notification and request changes"""
+    if not event.contains(db.session, 'after_flush', _collect):
+        event.listen(db.session, 'after_flush', _collect)
+        event.listen(db.session, 'after_commit', _apply)
+        event.listen(db.session, 'after_rollback', _discard)
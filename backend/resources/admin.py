@@ -1,46 +1,39 @@
 from flask import request
 from flask_restful import Resource, reqparse
 from flask_jwt_extended import jwt_required
-from utils import admin_required
+from utils import admin_required, set_user_active
 from models import *
-from sqlalchemy import func,desc
-import datetime
-from extensions import cache
+from sqlalchemy import desc
+from caching import cached, invalidate, professional_tags, PROFESSIONALS_LIST, CUSTOMERS_LIST
+from stats import get_stats
 
 from .professional import ProfessionalResource
 class AdminDashboardResource(Resource):
 
     @jwt_required()
     @admin_required
-    @cache.cached(timeout=30,key_prefix='admin_dashboard')
     def get(self):
-        total_customers = Customer.query.count()
-        total_professionals = Professional.query.count()
-        total_services = Service.query.count()
-        total_service_requests = ServiceRequest.query.count()
+        totals, recent = get_stats()
 
-        active_customers = Customer.query.join(User).filter(User.is_active==True).count()
-        verified_professionals = Professional.query.filter_by(verification_status='approved').count()
+        total_customers = totals.get('customers', 0)
+        total_professionals = totals.get('professionals', 0)
+        total_services = totals.get('services', 0)
+        total_service_requests = totals.get('service_requests', 0)
 
+        active_customers = totals.get('active_customers', 0)
+        verified_professionals = totals.get('verified_professionals', 0)
 
-        today = datetime.datetime.today()
-        last_week = today - datetime.timedelta(days=7)
+        new_customers = recent.get('new_customers', 0)
+        new_professionals = recent.get('new_professionals', 0)
+        new_requests = recent.get('new_requests', 0)
 
-        new_customers = Customer.query.filter(Customer.registered_on >= last_week).count()
-        new_professionals = Professional.query.filter(Professional.registered_on >= last_week).count()
-        new_requests = ServiceRequest.query.filter(ServiceRequest.request_date >= last_week).count()
-
-
-        status_counts = (
-            ServiceRequest.query
-            .with_entities(ServiceRequest.status, func.count().label('count'))
-            .group_by(ServiceRequest.status)
-            .all()
-        )
-
-        status_counts_dict = {status: count for status, count in status_counts}
+        status_counts_dict = {
+            field.split(':', 1)[1]: count
+            for field, count in totals.items()
+            if field.startswith('status:') and count > 0
+        }
 
-        pending_verifications = Professional.query.filter_by(verification_status='pending').count()
+        pending_verifications = totals.get('pending_verifications', 0)
 
         return {
             "total_counts": {
@@ -68,7 +61,7 @@ class AdminProfessionalsResource(Resource):
 
     @jwt_required()
     @admin_required
-    @cache.cached(timeout=30, key_prefix='admin_professionals', query_string=True)
+    @cached([PROFESSIONALS_LIST], timeout=30, key_prefix='admin_professionals', query_string=True)
     def get(self):
 
         status = request.args.get('status')
@@ -112,8 +105,9 @@ class AdminProfessionalsResource(Resource):
 
         try:
             professional.user.save_to_db()
+            set_user_active(professional.user_id, professional.user.is_active)
 
-            cache.clear()
+            invalidate(*professional_tags(professional))
             notification = Notification(
                 user_id=professional.user_id,
                 type='account_status',
@@ -134,7 +128,7 @@ class AdminCustomersResource(Resource):
 
     @jwt_required()
     @admin_required
-    @cache.cached(timeout=30, key_prefix='admin_customers', query_string=True)
+    @cached([CUSTOMERS_LIST], timeout=30, key_prefix='admin_customers', query_string=True)
     def get(self):
 
         status = request.args.get('status')
@@ -176,6 +170,7 @@ class AdminCustomersResource(Resource):
 
         try:
             customer.user.save_to_db()
+            set_user_active(customer.user_id, customer.user.is_active)
 
             notification = Notification(
                 user_id=customer.user_id,
@@ -185,11 +180,22 @@ class AdminCustomersResource(Resource):
 
             notification.save_to_db()
 
-            cache.clear()
+            invalidate(CUSTOMERS_LIST)
 
             return {
                 "message": f"Customer account has been {'activated' if customer.user.is_active else 'deactivated'}",
                 "customer": customer.to_dict()
             }, 200
         except Exception as e:
-            return {"message": f"An error occurred: {str(e)}"}, 500
\ No newline at end of file
+            return {"message": f"An error occurred: {str(e)}"}, 500
+
+class AdminReportRunsResource(Resource):
+
+    @jwt_required()
+    @admin_required
+    def get(self):
+        limit = min(request.args.get('limit', 12, type=int), 100)
+
+        runs = ReportRun.query.order_by(desc(ReportRun.started_at)).limit(limit).all()
+
+        return {"report_runs": [run.to_dict() for run in runs]}, 200
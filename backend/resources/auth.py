@@ -1,8 +1,14 @@
 from flask_restful import Resource,reqparse
-from flask_jwt_extended import create_access_token,create_refresh_token,jwt_required,get_jwt_identity,get_jwt
+from flask_jwt_extended import create_access_token,create_refresh_token,jwt_required,get_jwt_identity,get_jwt,decode_token
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt.exceptions import PyJWTError
 from flask import current_app, request
 from models import User,Customer,Professional,Service
+from utils import principal_claims
+from blocklist import revoked_tokens
+from caching import invalidate, CUSTOMERS_LIST, PROFESSIONALS_LIST
 import re
+import redis
 
 class UserRegister(Resource):
     def post(self):
@@ -69,9 +75,12 @@ class UserRegister(Resource):
                 )
 
                 professional.save_to_db()
+
+            invalidate(CUSTOMERS_LIST if data['role'] == 'customer' else PROFESSIONALS_LIST)
             
-            access_token = create_access_token(identity=user.id)
-            refresh_token = create_refresh_token(identity=user.id)
+            claims = principal_claims(user)
+            access_token = create_access_token(identity=str(user.id), additional_claims=claims)
+            refresh_token = create_refresh_token(identity=str(user.id), additional_claims=claims)
 
             return {
                 "message": "User created successfully",
@@ -99,11 +108,12 @@ class UserLogin(Resource):
             if not user.is_active:
                 return {"message": "Account is inactive. Please contact admin."}, 401
                 
-            access_token = create_access_token(identity=str(user.id))
-            refresh_token = create_refresh_token(identity=str(user.id))
+            claims = principal_claims(user)
+            access_token = create_access_token(identity=str(user.id), additional_claims=claims)
+            refresh_token = create_refresh_token(identity=str(user.id), additional_claims=claims)
             
-            customer_id = user.customer.id if user.customer else None
-            professional_id = user.professional.id if user.professional else None
+            customer_id = claims['customer_id']
+            professional_id = claims['professional_id']
             
 
             return {
@@ -132,7 +142,7 @@ class UserRefresh(Resource):
         if not user or not user.is_active:
             return {"message": "User not found or inactive"}, 401
             
-        access_token = create_access_token(identity=current_user_id)
+        access_token = create_access_token(identity=current_user_id, additional_claims=principal_claims(user))
         
         return {
             "message": "Token refreshed",
@@ -147,4 +157,25 @@ class UserLogout(Resource):
         if not token:
             return {"error": "Missing Authorization Header"}, 401
 
+        access_payload = get_jwt()
+        payloads = [access_payload]
+
+        # The refresh token is optional in the body; revoke it too so the session can't be renewed
+        refresh_token = (request.get_json(silent=True) or {}).get('refresh_token')
+        if refresh_token:
+            try:
+                refresh_payload = decode_token(refresh_token)
+            except (JWTExtendedException, PyJWTError):
+                return {"message": "Invalid refresh token"}, 400
+
+            if refresh_payload['sub'] == access_payload['sub']:
+                payloads.append(refresh_payload)
+
+        try:
+            for payload in payloads:
+                revoked_tokens.revoke(payload)
+        except redis.RedisError as e:
+            current_app.logger.error(f"Failed to revoke tokens: {str(e)}")
+            return {"message": "Logout is temporarily unavailable"}, 503
+
         return {"message": "Logged out successfully"}, 200
\ No newline at end of file
@@ -1,7 +1,8 @@
 from flask_restful import Resource, reqparse
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import Customer,User,ServiceRequest
-from utils import admin_required
+from flask_jwt_extended import jwt_required
+from models import Customer,User,ServiceRequest,Professional
+from utils import admin_required, current_principal, mark_user_deleted
+from caching import invalidate, professional_tag, CUSTOMERS_LIST, PROFESSIONALS_LIST
 from flask import request
 
 
@@ -9,11 +10,9 @@ class CustomerResource(Resource):
 
     @jwt_required()
     def get(self, customer_id):
-        current_user_id = get_jwt_identity()
-        user = User.query.get_or_404(current_user_id)
         customer = Customer.query.get_or_404(customer_id)
 
-        if user.id != customer.user_id and user.role != 'admin' :
+        if current_principal.user_id != customer.user_id and current_principal.role != 'admin' :
             return {"message": "Not authorized to view this profile"}, 403
 
         total_requests = ServiceRequest.query.filter_by(customer_id=customer_id).count()
@@ -38,12 +37,8 @@ class CustomerResource(Resource):
     
     @jwt_required()
     def put(self,customer_id):
-        current_user_id = get_jwt_identity()
-        user = User.query.get_or_404(current_user_id)
-        
-        
         customer = Customer.query.get_or_404(customer_id)
-        if user.id != customer.user_id and user.role != 'admin':
+        if current_principal.user_id != customer.user_id and current_principal.role != 'admin':
             return {"message": "Not authorized to update this profile"}, 403
         
 
@@ -70,6 +65,7 @@ class CustomerResource(Resource):
         try:
             customer.save_to_db()
             customer.user.save_to_db()
+            invalidate(CUSTOMERS_LIST)
             return {"message": "Profile updated successfully", "customer": customer.to_dict()}, 200
         except Exception as e:
             return {"message": f"An error occurred: {str(e)}"}, 500
@@ -79,10 +75,21 @@ class CustomerResource(Resource):
     def delete(self,customer_id):
         customer = Customer.query.get_or_404(customer_id)
 
+        # The customer's reviews go with it, so the affected ratings must be recounted
+        reviewed_professional_ids = {review.professional_id for review in customer.reviews}
+
         try:
             user = customer.user
+            user_id = user.id
             customer.delete_from_db()
             user.delete_from_db()
+            # Outstanding tokens of a deleted account are refused like a deactivated one
+            mark_user_deleted(user_id)
+            invalidate(CUSTOMERS_LIST)
+
+            if reviewed_professional_ids:
+                Professional.refresh_rating_stats(reviewed_professional_ids)
+                invalidate(*[professional_tag(pid) for pid in reviewed_professional_ids], PROFESSIONALS_LIST)
 
             return {"message": "Customer deleted successfully"}, 200
         except Exception as e:
@@ -1,19 +1,37 @@
 from flask_restful import Resource, reqparse
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required
 from models import Customer,User,ServiceRequest,ExportTask
-from utils import admin_required
-from flask import request
-from tasks.export_tasks import export_service_requests_to_csv
+from utils import admin_required, current_principal
+from flask import request, current_app, send_file, Response
+import os
+from tasks.export_tasks import export_service_requests_to_csv, export_content_type, export_progress, verify_download_token
+from export_formats import available_formats
 
 class ExportResource(Resource):
     @jwt_required()
     @admin_required
     def post(self):
-        current_user_id = get_jwt_identity()
+        parser = reqparse.RequestParser()
+        parser.add_argument('compress', type=bool, default=False)
+        parser.add_argument('shards', type=int, default=1)
+        parser.add_argument('format', type=str, default='csv')
+        parser.add_argument('mode', type=str, default='full', choices=('full', 'delta'),
+                            help="Mode must be 'full' or 'delta'")
+        data = parser.parse_args()
+
+        formats = available_formats()
+        if data['format'] not in formats:
+            return {"message": f"Format must be one of: {', '.join(formats)}"}, 400
+
+        max_shards = current_app.config.get('EXPORT_MAX_SHARDS', 16)
+        if not 1 <= data['shards'] <= max_shards:
+            return {"message": f"Shards must be between 1 and {max_shards}"}, 400
 
         export_task = ExportTask(
-            user_id=current_user_id,
+            user_id=current_principal.user_id,
             export_type='service_requests',
+            format=data['format'],
+            mode=data['mode'],
             status='pending'
         )
         export_task.save_to_db()
@@ -21,15 +39,19 @@ class ExportResource(Resource):
         try:
             from app import celery
             
-            if 'tasks.export_tasks.export_service_requests_to_csv' not in celery.tasks:
+            if data['shards'] > 1:
+                task_name = 'tasks.export_tasks.export_service_requests_sharded'
+                args = [export_task.id, data['shards'], data['compress'], data['format']]
+            else:
+                task_name = 'tasks.export_tasks.export_service_requests_to_csv'
+                args = [export_task.id, data['compress'], data['format']]
+
+            if task_name not in celery.tasks:
                 return {"message": "Task not registered with Celery"}, 500
                 
             print("Task is registered with Celery")
             
-            task = celery.send_task(
-                'tasks.export_tasks.export_service_requests_to_csv',
-                args=[export_task.id],
-            )
+            task = celery.send_task(task_name, args=args)
             print(f"Task sent to Celery: {task.id}")
             
             return {
@@ -47,4 +69,63 @@ class ExportResource(Resource):
             return {
                 "message": "Error while creating export task",
                 "error": str(e)
-            }, 500
\ No newline at end of file
+            }, 500
+
+
+class ExportStatusResource(Resource):
+    @jwt_required()
+    @admin_required
+    def get(self, export_id):
+        export_task = ExportTask.query.get_or_404(export_id)
+
+        export = export_task.to_dict()
+        export['rows_written'] = export_progress(export_task)
+        if export_task.status == 'completed':
+            export['download_url'] = f"/api/admin/export/{export_id}/download"
+        return {"export": export}, 200
+
+
+class ExportDownloadResource(Resource):
+    """
+    Serves a finished export to an admin, or to anyone holding the signed link from the
+    export email. Range requests are honoured so large downloads can resume.
+    """
+
+    def get(self, export_id):
+        token = request.args.get('token')
+        if token is None:
+            return self.download_as_admin(export_id)
+
+        if not verify_download_token(token, export_id):
+            return {"message": "Download link is invalid or has expired"}, 403
+        return send_export(export_id)
+
+    @jwt_required()
+    @admin_required
+    def download_as_admin(self, export_id):
+        return send_export(export_id)
+
+
+def send_export(export_id):
+    export_task = ExportTask.query.get_or_404(export_id)
+    if export_task.status != 'completed' or not export_task.file_path:
+        return {"message": f"Export is {export_task.status}"}, 409
+
+    filepath = os.path.join(current_app.root_path, export_task.file_path)
+    if not os.path.exists(filepath):
+        return {"message": "Export file no longer exists"}, 410
+
+    filename = os.path.basename(filepath)
+    content_type = export_content_type(export_task)
+
+    accel_prefix = current_app.config.get('EXPORT_ACCEL_REDIRECT_PREFIX')
+    if accel_prefix:
+        # nginx streams the file (including ranges) itself; this worker is free immediately
+        return Response(headers={
+            'X-Accel-Redirect': accel_prefix.rstrip('/') + '/' + filename,
+            'Content-Type': content_type,
+            'Content-Disposition': f'attachment; filename="{filename}"'
+        })
+
+    # conditional=True answers Range/If-Range and If-None-Match; USE_X_SENDFILE hands off to the server
+    return send_file(filepath, mimetype=content_type, as_attachment=True, download_name=filename, conditional=True)
@@ -1,17 +1,25 @@
 from flask_restful import Resource, reqparse
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required
 from models import Notification
-from flask import request
+from utils import current_principal
+from flask import Response, current_app, request, stream_with_context
+from datetime import datetime, timezone
+from sqlalchemy import func
+import redis
+from extensions import db, stream_redis_client
+from notifications import (
+    get_unread_count, unread_changed, reset_unread_count,
+    format_event, stream_events, STREAM_CHANNEL, STREAM_REPLAY_LIMIT
+)
 
 class NotificationResource(Resource):
 
     @jwt_required()
     def get(self, notification_id):
 
-        current_user_id = get_jwt_identity()
-        notification = Notification.query.filter_by(id=notification_id)
+        notification = Notification.query.get_or_404(notification_id)
 
-        if notification.user_id != current_user_id:
+        if notification.user_id != current_principal.user_id:
             return {"message": "Not authorized to view this notification"}, 403
         
         return {"notification": notification.to_dict()}, 200
@@ -19,11 +27,9 @@ class NotificationResource(Resource):
     @jwt_required()
     def put(self, notification_id):
 
-        current_user_id = get_jwt_identity()
-
         notification = Notification.query.filter(Notification.id == notification_id).first()
 
-        if int(notification.user_id) != int(current_user_id):
+        if notification.user_id != current_principal.user_id:
             return {"message": "Not authorized to update this notification"}, 403
         
         notification.is_read = True
@@ -37,11 +43,9 @@ class NotificationResource(Resource):
     @jwt_required()
     def delete(self, notification_id):
 
-        current_user_id = get_jwt_identity()
-
         notification = Notification.query.filter(Notification.id == notification_id).first()
 
-        if int(notification.user_id) != int(current_user_id):
+        if notification.user_id != current_principal.user_id:
             return {"message": "Not authorized to delete this notification"}, 403
             
         try:
@@ -56,7 +60,7 @@ class NotificationListResource(Resource):
     @jwt_required()
     def get(self):
         """Get user's notifications"""
-        current_user_id = get_jwt_identity()
+        current_user_id = current_principal.user_id
 
         unread_only = request.args.get('unread_only', 'false').lower() == 'true'
         limit = request.args.get('limit', type=int)
@@ -68,7 +72,7 @@ class NotificationListResource(Resource):
 
         notifications = query.order_by(Notification.created_at.desc()).limit(limit).all()
 
-        unread_count = Notification.query.filter_by(user_id=current_user_id, is_read=False).count()
+        unread_count = get_unread_count(current_user_id)
 
         return {
             "notifications": [notification.to_dict() for notification in notifications],
@@ -77,17 +81,132 @@ class NotificationListResource(Resource):
     
     @jwt_required()
     def put(self):
-        current_user_id = get_jwt_identity()
-        
-        unread_notifications = Notification.query.filter_by(user_id=current_user_id, is_read=False).all()
-        
-        for notification in unread_notifications:
-            notification.is_read = True
-            
+        """Mark all of the user's notifications as read"""
         try:
-            for notification in unread_notifications:
-                notification.save_to_db()
-                
-            return {"message": f"Marked {len(unread_notifications)} notifications as read"}, 200
+            count = Notification.query.filter_by(
+                user_id=current_principal.user_id,
+                is_read=False
+            ).update({'is_read': True}, synchronize_session=False)
+            unread_changed(current_principal.user_id, -count)
+            db.session.commit()
+
+            return {"message": f"Marked {count} notifications as read", "count": count}, 200
         except Exception as e:
-            return {"message": f"An error occurred: {str(e)}"}, 500
\ No newline at end of file
+            db.session.rollback()
+            return {"message": f"An error occurred: {str(e)}"}, 500
+
+
+class NotificationUnreadCountResource(Resource):
+
+    @jwt_required()
+    def get(self):
+        return {"unread_count": get_unread_count(current_principal.user_id)}, 200
+
+
+class NotificationStreamResource(Resource):
+
+    # EventSource can't set headers, so the token may also be passed as ?jwt=
+    @jwt_required(locations=['headers', 'query_string'])
+    def get(self):
+        """Server-Sent Events stream of the user's new notifications and request status changes"""
+        # Deactivated and deleted accounts were already refused by jwt_required (check_user_active)
+        user_id = current_principal.user_id
+
+        last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+        try:
+            last_event_id = int(last_event_id) if last_event_id else None
+        except ValueError:
+            return {"message": "Invalid Last-Event-ID"}, 400
+
+        try:
+            pubsub = stream_redis_client.pubsub(ignore_subscribe_messages=True)
+            # Subscribe before reading the backlog so nothing committed in between is missed
+            pubsub.subscribe(STREAM_CHANNEL.format(user_id))
+        except redis.RedisError as e:
+            current_app.logger.error(f"Could not open notification stream: {str(e)}")
+            return {"message": "Live notifications are unavailable"}, 503
+
+        backlog = []
+        if last_event_id is not None:
+            missed = Notification.query.filter(
+                Notification.user_id == user_id,
+                Notification.id > last_event_id
+            ).order_by(Notification.id).limit(STREAM_REPLAY_LIMIT + 1).all()
+
+            if len(missed) > STREAM_REPLAY_LIMIT:
+                # Too far behind to replay; the client reloads the list instead. The newest id becomes
+                # the browser's Last-Event-ID, so the next reconnect resumes from here
+                newest_id = db.session.query(func.max(Notification.id)).filter(Notification.user_id == user_id).scalar()
+                backlog.append(format_event('resync', {}, newest_id))
+                last_event_id = newest_id
+            else:
+                backlog = [format_event('notification', n.to_dict(), n.id) for n in missed]
+                if missed:
+                    last_event_id = missed[-1].id
+
+        # The stream stays open for minutes; don't hold a database connection meanwhile
+        db.session.remove()
+
+        events = stream_events(
+            pubsub,
+            backlog,
+            last_event_id,
+            heartbeat=current_app.config.get('NOTIFICATION_STREAM_HEARTBEAT', 15),
+            duration=current_app.config.get('NOTIFICATION_STREAM_TIMEOUT', 300)
+        )
+        return Response(stream_with_context(events), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            # Stop nginx from buffering the stream
+            'X-Accel-Buffering': 'no',
+        })
+
+
+class NotificationBulkResource(Resource):
+
+    @jwt_required()
+    def post(self):
+        """Mark as read or delete the given notifications, or all of them older than a timestamp"""
+        parser = reqparse.RequestParser()
+        parser.add_argument('action', type=str, required=True, help="Action cannot be blank")
+        parser.add_argument('ids', type=int, action='append')
+        parser.add_argument('before', type=str)
+
+        data = parser.parse_args()
+
+        if data['action'] not in ['read', 'delete']:
+            return {"message": "Action must be either 'read' or 'delete'"}, 400
+
+        if data['ids'] is None and data['before'] is None:
+            return {"message": "Provide either ids or before"}, 400
+
+        query = Notification.query.filter_by(user_id=current_principal.user_id)
+
+        if data['ids'] is not None:
+            query = query.filter(Notification.id.in_(data['ids']))
+
+        if data['before'] is not None:
+            try:
+                before = datetime.fromisoformat(data['before'].replace('Z', '+00:00'))
+            except ValueError:
+                return {"message": "Invalid date format. Use ISO format (YYYY-MM-DDTHH:MM:SS)"}, 400
+            if before.tzinfo:
+                # created_at is stored as naive UTC
+                before = before.astimezone(timezone.utc).replace(tzinfo=None)
+            query = query.filter(Notification.created_at < before)
+
+        try:
+            if data['action'] == 'read':
+                count = query.filter_by(is_read=False).update({'is_read': True}, synchronize_session=False)
+                unread_changed(current_principal.user_id, -count)
+                message = f"Marked {count} notifications as read"
+            else:
+                count = query.delete(synchronize_session=False)
+                # Deleted rows may or may not have been unread; let the counter be recounted
+                reset_unread_count(current_principal.user_id)
+                message = f"Deleted {count} notifications"
+            db.session.commit()
+
+            return {"message": message, "count": count}, 200
+        except Exception as e:
+            db.session.rollback()
+            return {"message": f"An error occurred: {str(e)}"}, 500
@@ -1,13 +1,15 @@
 from flask_restful import Resource, reqparse
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required
 from models.models import Professional, User, Service, Notification
-from utils import admin_required, professional_required
+from utils import admin_required, professional_required, current_principal, mark_user_deleted
 from flask import request, current_app
 from werkzeug.utils import secure_filename
 import os
 import uuid
-from extensions import cache
+from caching import conditional, invalidate, professional_tag, professional_tags, PROFESSIONALS_LIST, SERVICES_LIST
 class ProfessionalResource(Resource):
+    # The profile embeds its service name, which only changes along with the services list
+    @conditional(lambda professional_id: [professional_tag(professional_id), SERVICES_LIST])
     def get(self, professional_id):
         professional = Professional.query.get_or_404(professional_id)
         professional_data = professional.to_dict()
@@ -16,11 +18,8 @@ class ProfessionalResource(Resource):
     
     @jwt_required()
     def put(self, professional_id):
-        current_user_id = get_jwt_identity()
-        user = User.query.get_or_404(current_user_id)
-
         professional = Professional.query.get_or_404(professional_id)
-        if user.id != professional.user_id and user.role != 'admin':
+        if current_principal.user_id != professional.user_id and current_principal.role != 'admin':
             return {"message": "Not authorized to update this profile"}, 403
 
         parser = reqparse.RequestParser()
@@ -56,7 +55,7 @@ class ProfessionalResource(Resource):
         
         try:
             professional.save_to_db()
-            cache.clear()
+            invalidate(professional_tag(professional.id), PROFESSIONALS_LIST)
             return {"message": "Professional updated successfully", "professional": professional.to_dict()}, 200
         except Exception as e:
             return {"message": f"An error occurred: {str(e)}"}, 500
@@ -67,13 +66,18 @@ class ProfessionalResource(Resource):
         """Delete a professional (admin only)"""
         professional = Professional.query.get_or_404(professional_id)
         
+        tags = professional_tags(professional)
+
         try:
             
             user = professional.user
+            user_id = user.id
             professional.delete_from_db()
             user.delete_from_db()
+            # Outstanding tokens of a deleted account are refused like a deactivated one
+            mark_user_deleted(user_id)
 
-            cache.clear()
+            invalidate(*tags)
             
             return {"message": "Professional deleted successfully"}, 200
         except Exception as e:
@@ -81,11 +85,13 @@ class ProfessionalResource(Resource):
         
 class ProfessionalListResource(Resource):
 
+    @conditional([PROFESSIONALS_LIST])
     def get(self):
 
         service_id = request.args.get('service_id', type=int)
         verified_only = request.args.get('verified_only', 'true').lower() == 'true'
         rating_min = request.args.get('rating_min', type=float)
+        sort = request.args.get('sort')
         
         # Build query
         query = Professional.query
@@ -95,13 +101,15 @@ class ProfessionalListResource(Resource):
             
         if verified_only:
             query = query.filter_by(verification_status='approved')
+
+        if rating_min:
+            query = query.filter(Professional.average_rating >= rating_min)
+
+        if sort == 'rating':
+            query = query.order_by(Professional.average_rating.desc(), Professional.rating_count.desc())
             
         # Get professionals
         professionals = query.all()
-        
-        # Filter by rating if needed
-        if rating_min:
-            professionals = [p for p in professionals if p.get_average_rating() >= rating_min]
             
         result = [professional.to_dict() for professional in professionals]
         
@@ -135,7 +143,7 @@ class ProfessionalVerificationResource(Resource):
         try:
             professional.save_to_db()
             
-            cache.clear()
+            invalidate(*professional_tags(professional))
             notification = Notification(
                 user_id = professional.user_id,
                 type='verification',
@@ -155,10 +163,9 @@ class ProfessionalVerificationResource(Resource):
     @jwt_required()
     @professional_required
     def put(self, professional_id):
-        current_user_id = get_jwt_identity()
         professional = Professional.query.get_or_404(professional_id)
         
-        if int(professional.user_id) != int(current_user_id):
+        if professional.user_id != current_principal.user_id:
             print("Not authorized to update this profile")
             return {"message": "Not authorized to update this profile"}, 403
 
@@ -195,7 +202,7 @@ class ProfessionalVerificationResource(Resource):
             )
             notification.save_to_db()
 
-            cache.clear()
+            invalidate(*professional_tags(professional))
             return {
                 "message": "Document uploaded successfully",
                 "professional": professional.to_dict()
@@ -1,7 +1,8 @@
 from flask_restful import Resource, reqparse
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required
 from models import Review, Service, ServiceRequest,Customer, Professional,User,Notification
-from utils import customer_required
+from utils import customer_required, current_principal
+from caching import invalidate, professional_tag, PROFESSIONALS_LIST
 from flask import request
 
 
@@ -17,12 +18,11 @@ class ReviewResource(Resource):
     @customer_required
     def put(self, review_id):
 
-        current_user_id = get_jwt_identity()
-        customer = Customer.query.filter_by(user_id = current_user_id).first_or_404()
+        customer_id = current_principal.customer_id_or_404()
 
         review = Review.query.get_or_404(review_id)
 
-        if review.customer_id != customer.id:
+        if review.customer_id != customer_id:
             return {"message": "You are not authorized to update this review."}, 403
         
         parser = reqparse.RequestParser()
@@ -34,6 +34,7 @@ class ReviewResource(Resource):
         if data['rating'] is not None:
             if not 1 <= data['rating'] <= 5:
                 return {"message": "Rating must be between 1 and 5"}, 400
+            review.professional.change_rating(review.rating, data['rating'])
             review.rating = data['rating']
             
         if data['comment'] is not None:
@@ -41,6 +42,7 @@ class ReviewResource(Resource):
 
         try:
             review.save_to_db()
+            invalidate(professional_tag(review.professional_id), PROFESSIONALS_LIST)
 
             notification = Notification(
                 user_id=review.professional.user_id,
@@ -57,17 +59,20 @@ class ReviewResource(Resource):
     @customer_required
     def delete(self, review_id):
         """Delete a review (customer only)"""
-        current_user_id = get_jwt_identity()
-        customer = Customer.query.filter_by(user_id=current_user_id).first_or_404()
+        customer_id = current_principal.customer_id_or_404()
         
         review = Review.query.get_or_404(review_id)
         
         # Ensure the customer owns this review
-        if review.customer_id != customer.id:
+        if review.customer_id != customer_id:
             return {"message": "Not authorized to delete this review"}, 403
             
+        professional_id = review.professional_id
+        review.professional.remove_rating(review.rating)
+
         try:
             review.delete_from_db()
+            invalidate(professional_tag(professional_id), PROFESSIONALS_LIST)
             return {"message": "Review deleted successfully"}, 200
         except Exception as e:
             return {"message": f"An error occurred: {str(e)}"}, 500
@@ -104,8 +109,7 @@ class ReviewListResource(Resource):
     @customer_required
     def post(self):
         
-        current_user_id = get_jwt_identity()
-        customer = Customer.query.filter_by(user_id=current_user_id).first_or_404()
+        customer_id = current_principal.customer_id_or_404()
         
         parser = reqparse.RequestParser()
         parser.add_argument('service_request_id', type=int, required=True, help="Service request ID is required")
@@ -124,7 +128,7 @@ class ReviewListResource(Resource):
             return {"message": "Service request not found"}, 404
             
         
-        if service_request.customer_id != customer.id:
+        if service_request.customer_id != customer_id:
             return {"message": "Not authorized to review this service request"}, 403
             
         if service_request.status != 'closed':
@@ -136,14 +140,17 @@ class ReviewListResource(Resource):
             
         new_review = Review(
             service_request_id=service_request.id,
-            customer_id=customer.id,
+            customer_id=customer_id,
             professional_id=service_request.professional_id,
             rating=data['rating'],
             comment=data.get('comment', '')
         )
         
+        service_request.professional.add_rating(data['rating'])
+
         try:
             new_review.save_to_db()
+            invalidate(professional_tag(new_review.professional_id), PROFESSIONALS_LIST)
             
             notification = Notification(
                 user_id=service_request.professional.user_id,
@@ -4,10 +4,11 @@ from models import Service,Professional
 from utils import admin_required
 from sqlalchemy import or_
 from flask import request
-from extensions import cache
+from caching import cached, conditional, invalidate, service_tag, SERVICES_LIST, PROFESSIONALS_LIST
 class ServiceResource(Resource):
 
-    @cache.memoize(timeout=30)
+    @conditional(lambda service_id: [service_tag(service_id)])
+    @cached(lambda service_id: [service_tag(service_id)], timeout=30)
     def get(self,service_id):
 
         service = int(service_id)
@@ -39,7 +40,8 @@ class ServiceResource(Resource):
 
         try:
             service.save_to_db()
-            cache.clear()
+            # Professional listings embed the service name
+            invalidate(service_tag(service.id), SERVICES_LIST, PROFESSIONALS_LIST)
             return {"message": "Service updated successfully", "service": service.to_dict()}, 200
         
         except Exception as e:
@@ -57,7 +59,7 @@ class ServiceResource(Resource):
         
         try:
             service.delete_from_db()
-            cache.clear()
+            invalidate(service_tag(service_id), SERVICES_LIST)
             return {"message": "Service deleted successfully"}, 200
         
         except Exception as e:
@@ -66,7 +68,8 @@ class ServiceResource(Resource):
 
 class ServiceListResource(Resource):
 
-    @cache.cached(timeout=30,key_prefix='services_list',query_string=True)
+    @conditional([SERVICES_LIST])
+    @cached([SERVICES_LIST], timeout=30, key_prefix='services_list', query_string=True)
     def get(self):
         search_query = request.args.get('q','')
         show_inactive = request.args.get('show_inactive','false').lower() == 'true'
@@ -120,7 +123,7 @@ class ServiceListResource(Resource):
 
         try:
             service.save_to_db()
-            cache.clear()
+            invalidate(SERVICES_LIST)
             return {"message": "Service created successfully", "service": service.to_dict()}, 201   
         except Exception as e:
             return {"message": f"An error occurred : {str(e)}"}, 500
@@ -1,27 +1,42 @@
 from flask_restful import Resource, reqparse
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required
 from models import ServiceRequest,Customer,Professional,Service,User,RejectedServiceRequest,Notification
-from utils import customer_required,role_required
-from flask import request
+from utils import customer_required,role_required,current_principal
+from flask import request, current_app
 from datetime import datetime,timezone
+from sqlalchemy import and_, or_
+from extensions import cache
+from tasks.notification_tasks import notify_new_service_request
+import base64
+import hashlib
+import json
+
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(service_request):
+    """Opaque cursor pointing just past the given row in (request_date, id) order"""
+    payload = json.dumps([service_request.request_date.isoformat(), service_request.id])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor):
+    request_date, request_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    return datetime.fromisoformat(request_date), int(request_id)
 
 class ServiceRequestResource(Resource):
     
     @jwt_required()
     def get(self,request_id):
 
-        current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
-
         service_request = ServiceRequest.query.get(request_id)
 
-        if user.role == 'customer':
-            customer = Customer.query.filter_by(user_id=user.id).first()
-            if not customer or service_request.customer_id != customer.id:
+        if current_principal.role == 'customer':
+            if service_request.customer_id != current_principal.customer_id:
                 return {"message": "Not authorized to view this service request"}, 403
         
-        elif user.role == 'professional':
-            professional = Professional.query.filter_by(user_id=user.id).first()
+        elif current_principal.role == 'professional':
+            professional = current_principal.professional
 
             if not professional or (
                 service_request.professional_id != professional.id and
@@ -36,12 +51,11 @@ class ServiceRequestResource(Resource):
     @customer_required
     def put(self, request_id):
 
-        current_user_id = get_jwt_identity()
-        customer = Customer.query.filter_by(user_id=current_user_id).first_or_404()
+        customer_id = current_principal.customer_id_or_404()
         
         service_request = ServiceRequest.query.get_or_404(request_id)
 
-        if service_request.customer_id != customer.id:
+        if service_request.customer_id != customer_id:
             return {"message": "Not authorized to update this service request"}, 403
         
         if service_request.status in ['closed', 'cancelled']:
@@ -88,13 +102,12 @@ class ServiceRequestResource(Resource):
     @customer_required
     def delete(self, request_id):
         """Cancel a service request (customer only)"""
-        current_user_id = get_jwt_identity()
-        customer = Customer.query.filter_by(user_id=current_user_id).first_or_404()
+        customer_id = current_principal.customer_id_or_404()
         
         service_request = ServiceRequest.query.get_or_404(request_id)
         
         
-        if service_request.customer_id != customer.id:
+        if service_request.customer_id != customer_id:
             return {"message": "Not authorized to cancel this service request"}, 403
         
         
@@ -119,19 +132,15 @@ class ServiceRequestListResource(Resource):
     @jwt_required()
     def get(self):
 
-        current_user_id = get_jwt_identity()
-        
-        user = User.query.get_or_404(current_user_id)
-
         status = request.args.get('status')
 
-        if user.role == 'customer':
-            customer = Customer.query.filter_by(user_id=user.id).first_or_404()
-            query = ServiceRequest.query.filter_by(customer_id=customer.id)
+        if current_principal.role == 'customer':
+            customer_id = current_principal.customer_id_or_404()
+            query = ServiceRequest.query.filter_by(customer_id=customer_id)
 
-        elif user.role == 'professional':
+        elif current_principal.role == 'professional':
             
-            professional = Professional.query.filter_by(user_id=user.id).first_or_404()
+            professional = current_principal.professional_or_404()
             
             
             show_available = request.args.get('available', 'false').lower() == 'true'
@@ -145,19 +154,15 @@ class ServiceRequestListResource(Resource):
                     ServiceRequest.professional_id.is_(None)
                 )
                 if not include_rejected:
-
-                    rejected_requests = RejectedServiceRequest.query.filter_by(
-                        professional_id=professional.id
-                    ).with_entities(RejectedServiceRequest.service_request_id).all()
-                    
-                    rejected_ids = [req[0] for req in rejected_requests]
-
-                    if rejected_ids:
-                        query = query.filter(~ServiceRequest.id.in_(rejected_ids))
+                    rejected = RejectedServiceRequest.query.filter(
+                        RejectedServiceRequest.service_request_id == ServiceRequest.id,
+                        RejectedServiceRequest.professional_id == professional.id
+                    ).exists()
+                    query = query.filter(~rejected)
             else:
                 query = ServiceRequest.query.filter_by(professional_id=professional.id)
                 
-        elif user.role == 'admin':
+        elif current_principal.role == 'admin':
             
             query = ServiceRequest.query
             
@@ -198,18 +203,73 @@ class ServiceRequestListResource(Resource):
                 return {"message": "Invalid date_to format. Use ISO format (YYYY-MM-DDTHH:MM:SS)"}, 400
         
         
-        service_requests = query.order_by(ServiceRequest.request_date.desc()).all()
-        
-        return {
-            "service_requests": [req.to_dict() for req in service_requests],
-            "count": len(service_requests)
-        }, 200
+        limit = request.args.get('limit', type=int)
+        cursor = request.args.get('cursor')
+
+        if limit is None and cursor is None:
+            service_requests = (
+                query.options(*ServiceRequest.list_options())
+                .order_by(ServiceRequest.request_date.desc(), ServiceRequest.id.desc())
+                .all()
+            )
+
+            return {
+                "service_requests": ServiceRequest.to_dict_many(service_requests),
+                "count": len(service_requests)
+            }, 200
+
+        limit = min(max(limit or MAX_PAGE_SIZE, 1), MAX_PAGE_SIZE)
+        include_total = request.args.get('include_total', 'false').lower() == 'true'
+        total = self._cached_total(query) if include_total else None
+
+        if cursor:
+            try:
+                cursor_date, cursor_id = decode_cursor(cursor)
+            except (ValueError, TypeError):
+                return {"message": "Invalid cursor"}, 400
+            query = query.filter(or_(
+                ServiceRequest.request_date < cursor_date,
+                and_(ServiceRequest.request_date == cursor_date, ServiceRequest.id < cursor_id)
+            ))
+
+        # One extra row tells us whether there is a next page without a COUNT
+        service_requests = (
+            query.options(*ServiceRequest.list_options())
+            .order_by(ServiceRequest.request_date.desc(), ServiceRequest.id.desc())
+            .limit(limit + 1)
+            .all()
+        )
+        has_more = len(service_requests) > limit
+        service_requests = service_requests[:limit]
+
+        result = {
+            "service_requests": ServiceRequest.to_dict_many(service_requests),
+            "count": len(service_requests),
+            "next_cursor": encode_cursor(service_requests[-1]) if has_more else None
+        }
+        if include_total:
+            result["total"] = total
+        return result, 200
+
+    def _cached_total(self, query):
+        """Total matching rows for the current filters, cached separately from the pages"""
+        filters = sorted(
+            (key, value) for key, value in request.args.items()
+            if key not in ('cursor', 'limit', 'include_total')
+        )
+        digest = hashlib.sha1(json.dumps([current_principal.user_id, filters]).encode()).hexdigest()
+        cache_key = f"service_requests_total:{digest}"
+
+        total = cache.get(cache_key)
+        if total is None:
+            total = query.order_by(None).count()
+            cache.set(cache_key, total)
+        return total
 
     @jwt_required()
     @customer_required
     def post(self):
-        current_user_id = get_jwt_identity()
-        customer = Customer.query.filter_by(user_id=current_user_id).first_or_404()
+        customer_id = current_principal.customer_id_or_404()
         
         parser = reqparse.RequestParser()
         parser.add_argument('service_id', type=int, required=True, help="Service ID is required")
@@ -238,7 +298,7 @@ class ServiceRequestListResource(Resource):
             
         
         new_request = ServiceRequest(
-            customer_id=customer.id,
+            customer_id=customer_id,
             service_id=data['service_id'],
             professional_id=None,  
             request_date=datetime.utcnow(),
@@ -249,21 +309,15 @@ class ServiceRequestListResource(Resource):
         
         try:
             new_request.save_to_db()
-            
-            
-            professionals = Professional.query.filter_by(
-                service_id=data['service_id'],
-                verification_status='approved'
-            ).all()
-            
-            for professional in professionals:
-                notification = Notification(
-                    user_id=professional.user_id,
-                    type='new_request',
-                    message=f"A new service request is available in your area."
-                )
-                notification.save_to_db()
-            
+
+            # Fan-out to the service's professionals happens off the request path
+            try:
+                from app import celery
+                celery.send_task('tasks.notification_tasks.notify_new_service_request', args=[new_request.id])
+            except Exception as e:
+                current_app.logger.error(f"Could not queue notifications for request #{new_request.id}: {str(e)}")
+                notify_new_service_request(new_request.id)
+
             return {
                 "message": "Service request created successfully", 
                 "service_request": new_request.to_dict()
@@ -277,9 +331,6 @@ class ServiceRequestActionResource(Resource):
     @role_required(['professional','customer'])
     def post(self,request_id):
 
-        current_user_id = get_jwt_identity()
-        user = User.query.get_or_404(current_user_id)
-        
 
         service_request = ServiceRequest.query.get(request_id)
 
@@ -289,8 +340,8 @@ class ServiceRequestActionResource(Resource):
 
         data = parser.parse_args()
 
-        if user.role == 'professional':
-            professional = Professional.query.filter_by(user_id=user.id).first_or_404()
+        if current_principal.role == 'professional':
+            professional = current_principal.professional_or_404()
 
             if data['action'] == 'accept':
                 return self._handle_accept(service_request, professional)
@@ -301,14 +352,14 @@ class ServiceRequestActionResource(Resource):
             else:
                 return {"message": "Invalid action for professional"}, 400
             
-        elif user.role == 'customer':
-            customer = Customer.query.filter_by(user_id=user.id).first_or_404()
+        elif current_principal.role == 'customer':
+            customer_id = current_principal.customer_id_or_404()
 
-            if service_request.customer_id != customer.id:
+            if service_request.customer_id != customer_id:
                 return {"message": "Not authorized to take action on this service request"}, 403
             
             if data['action'] == 'close':
-                return self._handle_close(service_request, customer)
+                return self._handle_close(service_request, customer_id)
             else:
                 return {"message": "Invalid action for customer"}, 400
             
@@ -454,11 +505,11 @@ class ServiceRequestActionResource(Resource):
         except Exception as e:
             return {"message": f"An error occurred: {str(e)}"}, 500
         
-    def _handle_close(self, service_request, customer):
+    def _handle_close(self, service_request, customer_id):
         if service_request.status != 'completed':
             return {"message": "Only completed service requests can be closed"}, 400
         
-        if service_request.customer_id != customer.id:
+        if service_request.customer_id != customer_id:
             return {"message": "Not authorized to close this service request"}, 403
         
         service_request.status = 'closed'
@@ -485,11 +536,7 @@ class RejectedServiceRequestResource(Resource):
     @jwt_required()
     def get(self, request_id=None):
         """Get rejected service requests based on user role"""
-        current_user_id = get_jwt_identity()
-        user = User.query.get_or_404(current_user_id)
-        
-        
-        if user.role not in ['admin', 'professional']:
+        if current_principal.role not in ['admin', 'professional']:
             return {"message": "Unauthorized access"}, 403
         
         
@@ -528,8 +575,8 @@ class RejectedServiceRequestResource(Resource):
         
             service_request = ServiceRequest.query.get_or_404(request_id)
             
-            if user.role == 'professional':
-                professional = Professional.query.filter_by(user_id=user.id).first_or_404()
+            if current_principal.role == 'professional':
+                professional = current_principal.professional_or_404()
                 
         
                 if service_request.service_id != professional.service_id:
@@ -549,7 +596,7 @@ class RejectedServiceRequestResource(Resource):
                 }, 200
             
         
-            elif user.role == 'admin':
+            elif current_principal.role == 'admin':
                 rejections = RejectedServiceRequest.query.filter_by(
                     service_request_id=request_id
                 ).all()
@@ -562,8 +609,8 @@ class RejectedServiceRequestResource(Resource):
                 }, 200
         
         
-        if user.role == 'professional':
-            professional = Professional.query.filter_by(user_id=user.id).first_or_404()
+        if current_principal.role == 'professional':
+            professional = current_principal.professional_or_404()
             
             
             rejections = RejectedServiceRequest.query.filter_by(
@@ -578,7 +625,7 @@ class RejectedServiceRequestResource(Resource):
                 "count": len(result)
             }, 200
                 
-        elif user.role == 'admin':
+        elif current_principal.role == 'admin':
             
             query = RejectedServiceRequest.query
             
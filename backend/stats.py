@@ -0,0 +1,235 @@
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import event, func, inspect
+import redis
+from extensions import db, redis_client
+from models import User, Customer, Professional, Service, ServiceRequest
+
+TOTALS_KEY = 'stats:totals'
+DAILY_KEY = 'stats:daily:{}'
+# Buckets are kept a little longer than the 7-day window the dashboard shows
+DAILY_TTL = int(timedelta(days=9).total_seconds())
+RECENT_DAYS = 7
+# Present only in a hash written by reconcile_stats, so increments alone never look complete
+RECONCILED_FIELD = 'reconciled_at'
+
+VERIFICATION_COUNTERS = {
+    'approved': 'verified_professionals',
+    'pending': 'pending_verifications',
+}
+
+
+def _day(value):
+    return (value or datetime.utcnow()).strftime('%Y-%m-%d')
+
+
+def _history(obj, attribute):
+    """(old, new) if the attribute changed in this flush, else None"""
+    history = inspect(obj).attrs[attribute].history
+    if not history.has_changes() or not history.deleted:
+        return None
+    return history.deleted[0], history.added[0] if history.added else None
+
+
+class StatsDelta:
+    """Counter changes collected while flushing, applied to Redis once the transaction commits"""
+
+    def __init__(self):
+        self.totals = Counter()
+        self.daily = defaultdict(Counter)
+
+    def __bool__(self):
+        return any(self.totals.values()) or any(any(counters.values()) for counters in self.daily.values())
+
+    def customer(self, customer, sign):
+        self.totals['customers'] += sign
+        if customer.user is None or customer.user.is_active:
+            self.totals['active_customers'] += sign
+        self.daily[_day(customer.registered_on)]['new_customers'] += sign
+
+    def professional(self, professional, sign):
+        self.totals['professionals'] += sign
+        counter = VERIFICATION_COUNTERS.get(professional.verification_status or 'pending')
+        if counter:
+            self.totals[counter] += sign
+        self.daily[_day(professional.registered_on)]['new_professionals'] += sign
+
+    def verification_change(self, old, new):
+        for status, sign in ((old or 'pending', -1), (new, 1)):
+            counter = VERIFICATION_COUNTERS.get(status)
+            if counter:
+                self.totals[counter] += sign
+
+    def service_request(self, service_request, sign):
+        self.totals['service_requests'] += sign
+        self.totals[f'status:{service_request.status or "requested"}'] += sign
+        self.daily[_day(service_request.request_date)]['new_requests'] += sign
+
+    def status_change(self, old, new):
+        self.totals[f'status:{old}'] -= 1
+        self.totals[f'status:{new}'] += 1
+
+
+def _collect(session, flush_context):
+    delta = session.info.setdefault('stats_delta', StatsDelta())
+
+    for obj in session.new:
+        if isinstance(obj, Customer):
+            delta.customer(obj, 1)
+        elif isinstance(obj, Professional):
+            delta.professional(obj, 1)
+        elif isinstance(obj, Service):
+            delta.totals['services'] += 1
+        elif isinstance(obj, ServiceRequest):
+            delta.service_request(obj, 1)
+
+    for obj in session.deleted:
+        if isinstance(obj, Customer):
+            delta.customer(obj, -1)
+        elif isinstance(obj, Professional):
+            delta.professional(obj, -1)
+        elif isinstance(obj, Service):
+            delta.totals['services'] -= 1
+        elif isinstance(obj, ServiceRequest):
+            delta.service_request(obj, -1)
+
+    for obj in session.dirty:
+        if isinstance(obj, User) and obj.role == 'customer':
+            change = _history(obj, 'is_active')
+            if change and bool(change[0]) != bool(change[1]):
+                delta.totals['active_customers'] += 1 if change[1] else -1
+        elif isinstance(obj, Professional):
+            change = _history(obj, 'verification_status')
+            if change and change[0] != change[1]:
+                delta.verification_change(*change)
+        elif isinstance(obj, ServiceRequest):
+            change = _history(obj, 'status')
+            if change and change[0] != change[1]:
+                delta.status_change(*change)
+
+
+def _apply(session):
+    delta = session.info.pop('stats_delta', None)
+    if not delta:
+        return
+
+    try:
+        pipe = redis_client.pipeline()
+        for field, amount in delta.totals.items():
+            if amount:
+                pipe.hincrby(TOTALS_KEY, field, amount)
+        for day, counters in delta.daily.items():
+            key = DAILY_KEY.format(day)
+            for field, amount in counters.items():
+                if amount:
+                    pipe.hincrby(key, field, amount)
+            pipe.expire(key, DAILY_TTL)
+        pipe.execute()
+    except redis.RedisError as e:
+        # The periodic reconciliation repairs whatever we miss here
+        current_app.logger.warning(f"Failed to update dashboard stats: {str(e)}")
+
+
+def _discard(session, *args):
+    session.info.pop('stats_delta', None)
+
+
+def compute_stats():
+    """Dashboard counters straight from SQL, used to seed and reconcile the Redis copy"""
+    totals = {
+        'customers': Customer.query.count(),
+        'professionals': Professional.query.count(),
+        'services': Service.query.count(),
+        'service_requests': ServiceRequest.query.count(),
+        'active_customers': Customer.query.join(User).filter(User.is_active == True).count(),
+        'verified_professionals': Professional.query.filter_by(verification_status='approved').count(),
+        'pending_verifications': Professional.query.filter_by(verification_status='pending').count(),
+    }
+
+    status_counts = (
+        ServiceRequest.query
+        .with_entities(ServiceRequest.status, func.count())
+        .group_by(ServiceRequest.status)
+        .all()
+    )
+    for status, count in status_counts:
+        totals[f'status:{status}'] = count
+
+    since = datetime.combine(datetime.utcnow().date() - timedelta(days=RECENT_DAYS), datetime.min.time())
+    daily = defaultdict(dict)
+    for field, column in (
+        ('new_customers', Customer.registered_on),
+        ('new_professionals', Professional.registered_on),
+        ('new_requests', ServiceRequest.request_date),
+    ):
+        rows = (
+            db.session.query(func.date(column), func.count())
+            .filter(column >= since)
+            .group_by(func.date(column))
+            .all()
+        )
+        for day, count in rows:
+            daily[str(day)][field] = count
+
+    return totals, daily
+
+
+def reconcile_stats():
+    """Overwrite the Redis counters with freshly computed values"""
+    totals, daily = compute_stats()
+    today = datetime.utcnow().date()
+
+    pipe = redis_client.pipeline()
+    pipe.delete(TOTALS_KEY)
+    pipe.hset(TOTALS_KEY, mapping={**totals, RECONCILED_FIELD: int(datetime.utcnow().timestamp())})
+    for offset in range(RECENT_DAYS + 1):
+        day = (today - timedelta(days=offset)).strftime('%Y-%m-%d')
+        key = DAILY_KEY.format(day)
+        pipe.delete(key)
+        counters = daily.get(day)
+        if counters:
+            pipe.hset(key, mapping=counters)
+            pipe.expire(key, DAILY_TTL)
+    pipe.execute()
+
+    return totals
+
+
+def get_stats():
+    """Current counters and the last-7-day sums, built from per-day buckets"""
+    today = datetime.utcnow().date()
+    days = [(today - timedelta(days=offset)).strftime('%Y-%m-%d') for offset in range(RECENT_DAYS)]
+
+    try:
+        pipe = redis_client.pipeline()
+        pipe.hgetall(TOTALS_KEY)
+        for day in days:
+            pipe.hgetall(DAILY_KEY.format(day))
+        totals, *buckets = pipe.execute()
+
+        if RECONCILED_FIELD not in totals:
+            reconcile_stats()
+            return get_stats()
+
+        totals = {field: int(value) for field, value in totals.items() if field != RECONCILED_FIELD}
+        recent = Counter()
+        for bucket in buckets:
+            recent.update({field: int(value) for field, value in bucket.items()})
+
+    except redis.RedisError as e:
+        current_app.logger.warning(f"Dashboard stats unavailable in Redis, computing from SQL: {str(e)}")
+        totals, daily = compute_stats()
+        recent = Counter()
+        for day in days:
+            recent.update(daily.get(day, {}))
+
+    return totals, recent
+
+
+def init_stats(app):
+    """Keep the dashboard counters up to date from committed ORM changes"""
+    if not event.contains(db.session, 'after_flush', _collect):
+        event.listen(db.session, 'after_flush', _collect)
+        event.listen(db.session, 'after_commit', _apply)
+        event.listen(db.session, 'after_rollback', _discard)
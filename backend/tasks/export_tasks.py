@@ -1,16 +1,31 @@
-from celery import shared_task
-from models import ServiceRequest, ExportTask, User, Notification
-from datetime import datetime
+from celery import chord, shared_task
+from models import ServiceRequest, ExportTask, User, Customer, Professional, Service, Notification
+from extensions import db, redis_client
+from datetime import datetime, timedelta
 import os
-import csv
+import redis
 from flask import current_app
-from mail_config import mail
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from sqlalchemy import func, select
+from sqlalchemy.orm import aliased
+from export_formats import EXPORT_FORMATS
+from mail_config import enqueue_email
+from templating import render_template
 from flask_mail import Message
 
+# Rows fetched per round trip, and how often progress is reported while streaming
+EXPORT_BATCH_SIZE = 5000
+PROGRESS_INTERVAL = 50000
+
+EXPORT_PROGRESS_KEY = 'export:progress:{}'
+EXPORT_PROGRESS_TTL = 86400
+DOWNLOAD_TOKEN_SALT = 'export-download'
+
+
 @shared_task
-def export_service_requests_to_csv(export_id):
+def export_service_requests_to_csv(export_id, compress=False, format='csv'):
     """
-    Export service requests to CSV and email to admin
+    Export service requests (CSV by default, or any of export_formats.EXPORT_FORMATS) and email to admin
     """
     export_task = ExportTask.query.get(export_id)
     if not export_task:
@@ -18,134 +33,358 @@ def export_service_requests_to_csv(export_id):
         return "Export task not found"
     
     try:
-        export_task.status = 'processing'
-        export_task.save_to_db()
-        
-        exports_dir = os.path.join(current_app.root_path, 'static', 'exports')
-        os.makedirs(exports_dir, exist_ok=True)
-        
-        timestamp = datetime.utcnow().strftime('%Y%m%d%H%M%S')
-        filename = f"service_requests_{timestamp}.csv"
-        filepath = os.path.join(exports_dir, filename)
+        if export_task.status != 'processing':
+            start_export(export_task)
+
+        filename, filepath = export_file_path(export_id, format, compress, export_task.mode)
         
-        success = export_service_requests(filepath)
+        row_count = export_service_requests(
+            filepath,
+            compress=compress,
+            progress=lambda rows: record_progress(export_id, rows),
+            updated_range=updated_range(export_task),
+            format=format
+        )
         
-        if success:
-            export_task.status = 'completed'
-            export_task.file_path = f"static/exports/{filename}"
-            export_task.completed_at = datetime.utcnow()
-            export_task.save_to_db()
-            
-            notification = Notification(
-                user_id=export_task.user_id,
-                type='export_complete',
-                message="Your service requests export is ready. A copy has been sent to your email."
-            )
-            notification.save_to_db()
-            
-            admin = User.query.get(export_task.user_id)
-            if admin and admin.email:
-                send_csv_to_admin(admin.email, filepath)
-            
+        if row_count is not None:
+            complete_export(export_task, filename, filepath, row_count)
             return f"Export task {export_id} completed successfully"
         else:
-            export_task.status = 'failed'
-            export_task.save_to_db()
-            
-            notification = Notification(
-                user_id=export_task.user_id,
-                type='export_failed',
-                message="Your service requests export could not be generated."
-            )
-            notification.save_to_db()
-            
+            fail_export(export_task, "Your service requests export could not be generated.")
             return f"Export failed"
             
     except Exception as e:
-        export_task.status = 'failed'
-        export_task.save_to_db()
-        
-        notification = Notification(
-            user_id=export_task.user_id,
-            type='export_failed',
-            message=f"Your service requests export failed: {str(e)}"
-        )
-        notification.save_to_db()
+        db.session.rollback()
+        fail_export(export_task, f"Your service requests export failed: {str(e)}")
 
         print(f"Error exporting service requests: {str(e)}")
         current_app.logger.error(f"Error exporting service requests: {str(e)}")
         
         return f"Export failed with error: {str(e)}"
 
-def export_service_requests(filepath):
+
+@shared_task
+def export_service_requests_sharded(export_id, shards, compress=False, format='csv'):
     """
-    Export all service requests to CSV
+    Split the export into contiguous id ranges written in parallel by export_shard tasks;
+    assemble_sharded_export stitches the parts together once all of them are done.
     """
+    export_task = ExportTask.query.get(export_id)
+    if not export_task:
+        current_app.logger.error(f"Export task {export_id} not found")
+        return "Export task not found"
+
+    start_export(export_task)
+
+    filename, filepath = export_file_path(export_id, format, compress, export_task.mode)
+    ranges = shard_ranges(shards, updated_range(export_task))
+    if not ranges:
+        # Nothing to split; a single (header-only) export is just as fast
+        return export_service_requests_to_csv(export_id, compress, format)
+
+    parts = [f"{filepath}.part{index}" for index in range(len(ranges))]
+    chord(
+        export_shard.s(export_id, part, first_id, last_id, compress, format)
+        for part, (first_id, last_id) in zip(parts, ranges)
+    )(assemble_sharded_export.s(export_id, filename, filepath, parts, compress, format))
+
+    return f"Export task {export_id} split into {len(ranges)} shards"
+
+
+@shared_task
+def export_shard(export_id, part_path, first_id, last_id, compress=False, format='csv'):
+    """Write one id range of the export, without a header. Returns the row count, or None on failure"""
+    export_task = ExportTask.query.get(export_id)
+    if not export_task:
+        current_app.logger.error(f"Export task {export_id} not found")
+        return None
+
+    return export_service_requests(
+        part_path,
+        compress=compress,
+        progress=lambda rows: record_progress(export_id, rows),
+        id_range=(first_id, last_id),
+        updated_range=updated_range(export_task),
+        header=False,
+        format=format
+    )
+
+
+@shared_task
+def assemble_sharded_export(row_counts, export_id, filename, filepath, parts, compress=False, format='csv'):
+    """Chord callback: combine the shard files in id order into the final export"""
+    export_task = ExportTask.query.get(export_id)
+    if not export_task:
+        current_app.logger.error(f"Export task {export_id} not found")
+        return "Export task not found"
+
     try:
-        
-        requests = ServiceRequest.query.all()
-        
-        
-        with open(filepath, 'w', newline='') as csvfile:
-            fieldnames = [
-                'ID', 'Customer', 'Service', 'Professional',
-                'Request Date', 'Scheduled Date', 'Completion Date', 
-                'Status', 'Price', 'Remarks'
-            ]
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
-            
-            for req in requests:
-                writer.writerow({
-                    'ID': req.id,
-                    'Customer': req.customer.user.name,
-                    'Service': req.service.name,
-                    'Professional': req.professional.user.name if req.professional else "Not Assigned",
-                    'Request Date': req.request_date.strftime('%Y-%m-%d') if req.request_date else "N/A",
-                    'Scheduled Date': req.scheduled_date.strftime('%Y-%m-%d') if req.scheduled_date else "N/A",
-                    'Completion Date': req.completion_date.strftime('%Y-%m-%d') if req.completion_date else "N/A",
-                    'Status': req.status,
-                    'Price': req.service.base_price,
-                    'Remarks': req.remarks or "None"
-                })
-        
-        return True
+        if any(count is None for count in row_counts):
+            fail_export(export_task, "Your service requests export could not be generated.")
+            return "Export failed"
+
+        EXPORT_FORMATS[format].assemble(filepath, parts, compress)
+
+        complete_export(export_task, filename, filepath, sum(row_counts))
+        return f"Export task {export_id} completed successfully"
+
+    except Exception as e:
+        db.session.rollback()
+        fail_export(export_task, f"Your service requests export failed: {str(e)}")
+        current_app.logger.error(f"Error assembling sharded export: {str(e)}")
+        return f"Export failed with error: {str(e)}"
+
+    finally:
+        for part in parts:
+            if os.path.exists(part):
+                os.remove(part)
+
+
+def start_export(export_task):
+    """
+    Mark the export as processing and fix the window of rows it covers. Every export records
+    its start time as the watermark; a delta export also starts from the watermark of the last
+    completed export of the same type, less EXPORT_DELTA_OVERLAP. Without one it is a full dump.
+    """
+    export_task.status = 'processing'
+    export_task.watermark = datetime.utcnow()
+    export_task.delta_since = None
+
+    if export_task.mode == 'delta':
+        previous = (
+            ExportTask.query
+            .filter(
+                ExportTask.export_type == export_task.export_type,
+                ExportTask.status == 'completed',
+                ExportTask.watermark.isnot(None),
+                ExportTask.id != export_task.id
+            )
+            .order_by(ExportTask.watermark.desc())
+            .first()
+        )
+        if previous:
+            overlap = timedelta(seconds=current_app.config.get('EXPORT_DELTA_OVERLAP', 300))
+            export_task.delta_since = previous.watermark - overlap
+
+    export_task.save_to_db()
+    reset_progress(export_task.id)
+
+
+def updated_range(export_task):
+    """The [since, until) bounds on last_updated for a delta export, None for a full dump"""
+    if export_task.delta_since is None:
+        return None
+    return export_task.delta_since, export_task.watermark
+
+
+def export_file_path(export_id, format='csv', compress=False, mode='full'):
+    exports_dir = os.path.join(current_app.root_path, 'static', 'exports')
+    os.makedirs(exports_dir, exist_ok=True)
+
+    writer = EXPORT_FORMATS[format]
+    timestamp = datetime.utcnow().strftime('%Y%m%d%H%M%S')
+    prefix = 'service_requests_delta' if mode == 'delta' else 'service_requests'
+    # The export id keeps two exports started in the same second from sharing (and serving) one file
+    filename = f"{prefix}_{timestamp}_{export_id}.{writer.extension}" + ('.gz' if compress and writer.compressible else '')
+    return filename, os.path.join(exports_dir, filename)
+
+
+def shard_ranges(shards, updated_range=None):
+    """Split the ids to export into up to `shards` contiguous, inclusive (first_id, last_id) ranges"""
+    query = db.session.query(func.min(ServiceRequest.id), func.max(ServiceRequest.id))
+    if updated_range is not None:
+        query = query.filter(updated_between(*updated_range))
+    low, high = query.one()
+    if low is None:
+        return []
+
+    size = max(1, -(-(high - low + 1) // shards))
+    return [(start, min(start + size - 1, high)) for start in range(low, high + 1, size)]
+
+
+def complete_export(export_task, filename, filepath, row_count):
+    export_task.status = 'completed'
+    export_task.row_count = row_count
+    export_task.file_path = f"static/exports/{filename}"
+    export_task.completed_at = datetime.utcnow()
+    export_task.save_to_db()
+
+    notification = Notification(
+        user_id=export_task.user_id,
+        type='export_complete',
+        message="Your service requests export is ready. A download link has been sent to your email."
+    )
+    notification.save_to_db()
+
+    admin = User.query.get(export_task.user_id)
+    if admin and admin.email:
+        send_csv_to_admin(admin.email, export_download_url(export_task.id), f"export_ready:{export_task.id}")
+
+
+def fail_export(export_task, message):
+    export_task.status = 'failed'
+    export_task.save_to_db()
+
+    notification = Notification(
+        user_id=export_task.user_id,
+        type='export_failed',
+        message=message
+    )
+    notification.save_to_db()
+
+def updated_between(since, until):
+    return (ServiceRequest.last_updated >= since) & (ServiceRequest.last_updated < until)
+
+
+def service_request_rows(id_range=None, updated_range=None):
+    """
+    One flat row per service request, from a single joined query instead of
+    lazy-loading customer, service and professional for every request.
+    """
+    customer_user = aliased(User)
+    professional_user = aliased(User)
+
+    query = (
+        select(
+            ServiceRequest.id,
+            customer_user.name,
+            Service.name,
+            professional_user.name,
+            ServiceRequest.request_date,
+            ServiceRequest.scheduled_date,
+            ServiceRequest.completion_date,
+            ServiceRequest.status,
+            Service.base_price,
+            ServiceRequest.remarks
+        )
+        .join(Customer, ServiceRequest.customer_id == Customer.id)
+        .join(customer_user, Customer.user_id == customer_user.id)
+        .join(Service, ServiceRequest.service_id == Service.id)
+        .outerjoin(Professional, ServiceRequest.professional_id == Professional.id)
+        .outerjoin(professional_user, Professional.user_id == professional_user.id)
+        .order_by(ServiceRequest.id)
+    )
+    if id_range is not None:
+        query = query.where(ServiceRequest.id.between(*id_range))
+    if updated_range is not None:
+        query = query.where(updated_between(*updated_range))
+    return query
+
+
+def export_content_type(export_task):
+    if export_task.file_path and export_task.file_path.endswith('.gz'):
+        return 'application/gzip'
+    return EXPORT_FORMATS[export_task.format or 'csv'].content_type
+
+
+def _download_serializer():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt=DOWNLOAD_TOKEN_SALT)
+
+
+def export_download_url(export_id):
+    """Signed link to download an export without logging in, valid for EXPORT_LINK_MAX_AGE"""
+    token = _download_serializer().dumps(export_id)
+    base_url = current_app.config.get('PUBLIC_BASE_URL', 'http://localhost:5000').rstrip('/')
+    return f"{base_url}/api/admin/export/{export_id}/download?token={token}"
+
+
+def verify_download_token(token, export_id):
+    try:
+        signed_id = _download_serializer().loads(
+            token, max_age=current_app.config.get('EXPORT_LINK_MAX_AGE', 7 * 24 * 3600)
+        )
+    except BadSignature:
+        return False
+    return signed_id == export_id
+
+
+def export_progress(export_task):
+    """Rows written so far: the running total in Redis while the export runs, row_count once it is done"""
+    if export_task.status == 'completed':
+        return export_task.row_count
+    if export_task.status == 'pending':
+        return 0
+
+    try:
+        rows = redis_client.get(EXPORT_PROGRESS_KEY.format(export_task.id))
+        return int(rows) if rows is not None else None
+    except redis.RedisError as e:
+        current_app.logger.warning(f"Could not read export progress: {str(e)}")
+        return None
+
+
+def reset_progress(export_id):
+    try:
+        redis_client.set(EXPORT_PROGRESS_KEY.format(export_id), 0, ex=EXPORT_PROGRESS_TTL)
+    except redis.RedisError as e:
+        current_app.logger.warning(f"Could not record export progress: {str(e)}")
+
+
+def record_progress(export_id, rows):
+    """
+    Add rows written to the export's running total in Redis. Shards report into the same
+    key, and writing progress to the ExportTask mid-stream would need a second transaction,
+    which SQLite refuses while the export's read is still open.
+    """
+    try:
+        redis_client.incrby(EXPORT_PROGRESS_KEY.format(export_id), rows)
+    except redis.RedisError as e:
+        current_app.logger.warning(f"Could not record export progress: {str(e)}")
+
+
+def export_service_requests(filepath, compress=False, progress=None, id_range=None, updated_range=None,
+                            header=True, format='csv'):
+    """
+    Stream service requests (all of them, or those in an inclusive id range and/or a half-open
+    last_updated range) to a file, EXPORT_BATCH_SIZE rows at a time, so memory stays flat however
+    large the table is. `progress` is called with the rows written since its previous call.
+    Returns the number of rows written, or None on failure.
+    """
+    try:
+        result = db.session.execute(
+            service_request_rows(id_range, updated_range).execution_options(yield_per=EXPORT_BATCH_SIZE)
+        )
+
+        rows_written = 0
+        reported = 0
+        writer = EXPORT_FORMATS[format](filepath, compress=compress, header=header)
+        try:
+            for batch in result.partitions():
+                writer.write(batch)
+                rows_written += len(batch)
+
+                if progress and rows_written - reported >= PROGRESS_INTERVAL:
+                    progress(rows_written - reported)
+                    reported = rows_written
+        finally:
+            writer.close()
+
+        result.close()
+        if progress and rows_written > reported:
+            progress(rows_written - reported)
+        return rows_written
         
     except Exception as e:
+        db.session.rollback()
         current_app.logger.error(f"Error exporting service requests: {str(e)}")
-        return False
+        return None
 
-def send_csv_to_admin(email, filepath):
+def send_csv_to_admin(email, download_url, idempotency_key=None):
     """
-    Send the CSV export to the admin's email
+    Email the admin a link to the export; attaching it would load the whole file into memory
     """
     try:
+        expires = datetime.utcnow() + timedelta(seconds=current_app.config.get('EXPORT_LINK_MAX_AGE', 7 * 24 * 3600))
         msg = Message(
             subject="Service Sphere - Service Requests Export",
             recipients=[email],
             sender=current_app.config.get('MAIL_DEFAULT_SENDER', 'no_reply@example.com')
         )
         
-        msg.body = f"""Hello,
-
-Your service requests export has been completed.
-The file is attached to this email.
-
-Thank you for using Service Sphere.
-
-Best regards,
-Service Sphere Team
-"""
-        
-        with open(filepath, 'rb') as fp:
-            msg.attach(
-                filename=os.path.basename(filepath),
-                content_type='text/csv',
-                data=fp.read()
-            )
+        msg.body = render_template('emails/export_ready.txt', download_url=download_url, expires=expires)
         
-        mail.send(msg)
-        current_app.logger.info(f"Export email sent to {email}")
+        enqueue_email(msg, idempotency_key)
+        current_app.logger.info(f"Export email queued for {email}")
         return True
         
     except Exception as e:
@@ -0,0 +1,162 @@
+from datetime import datetime, timedelta
+import json
+import uuid
+from celery import shared_task
+from flask import current_app
+from flask_mail import Message
+from sqlalchemy import and_, delete, or_, select, update
+from extensions import db
+from models import OutboxEmail
+from mail_config import send_messages
+
+
+@shared_task
+def drain_outbox():
+    """
+    Deliver queued emails in batches of MAIL_OUTBOX_BATCH_SIZE, over the pooled connections of
+    send_messages. Each attempt is counted when the row is claimed; a transient failure is retried
+    on a later run with exponential backoff, a permanent one (or MAIL_OUTBOX_MAX_ATTEMPTS) marks
+    it failed.
+
+    Rows are claimed with a token before sending, so concurrent runs never share a row. Delivery
+    is at least once: a worker that dies after the SMTP server accepted a batch but before the
+    rows were marked sent will have that batch resent once its claim expires.
+    """
+    config = current_app.config
+    batch_size = config.get('MAIL_OUTBOX_BATCH_SIZE', 500)
+
+    sent = retried = failed = 0
+
+    for _ in range(config.get('MAIL_OUTBOX_MAX_BATCHES', 20)):
+        rows = claim_outbox_batch(batch_size)
+        if not rows:
+            break
+
+        now = datetime.utcnow()
+        messages = []
+        for row in rows:
+            try:
+                messages.append((row, outbox_message(row)))
+            except Exception as e:
+                # A row that can't be turned into a message never will be; don't let it hold up the batch
+                current_app.logger.error(f"Outbox email #{row.id} is malformed: {str(e)}")
+                record_attempt(row, e, True, now)
+                failed += 1
+
+        try:
+            errors = {
+                id(message): (error, permanent)
+                for message, error, permanent in send_messages([message for _, message in messages])
+            }
+        except Exception as e:
+            db.session.rollback()
+            for row, _ in messages:
+                record_attempt(row, e, False, datetime.utcnow())
+            db.session.commit()
+            raise
+
+        now = datetime.utcnow()
+        for row, message in messages:
+            error, permanent = errors.get(id(message), (None, False))
+            status = record_attempt(row, error, permanent, now)
+            if status == 'sent':
+                sent += 1
+            elif status == 'failed':
+                failed += 1
+            else:
+                retried += 1
+
+        db.session.commit()
+
+    return f"Outbox: {sent} sent, {retried} to retry, {failed} failed"
+
+
+def record_attempt(row, error, permanent, now):
+    """Release a claimed row as sent, pending a retry, or failed, and return its new status"""
+    row.claim_token = None
+
+    if error is None:
+        row.status = 'sent'
+        row.sent_at = now
+        row.last_error = None
+    elif permanent or row.attempts >= current_app.config.get('MAIL_OUTBOX_MAX_ATTEMPTS', 8):
+        row.status = 'failed'
+        row.last_error = str(error)
+    else:
+        row.status = 'pending'
+        row.last_error = str(error)
+        row.next_attempt_at = now + timedelta(
+            seconds=current_app.config.get('MAIL_OUTBOX_RETRY_DELAY', 60) * 2 ** (row.attempts - 1)
+        )
+    return row.status
+
+
+def claim_outbox_batch(limit):
+    """
+    Mark up to `limit` due rows as sending under a fresh token, count the attempt, and return them.
+    The attempt is counted up front so a row whose batch keeps crashing the worker still runs out
+    of attempts: once its claim has expired MAIL_OUTBOX_MAX_ATTEMPTS times it is marked failed.
+    """
+    now = datetime.utcnow()
+    token = uuid.uuid4().hex
+    expired = and_(
+        OutboxEmail.status == 'sending',
+        OutboxEmail.claimed_at < now - timedelta(seconds=current_app.config.get('MAIL_OUTBOX_CLAIM_TIMEOUT', 900))
+    )
+    out_of_attempts = OutboxEmail.attempts >= current_app.config.get('MAIL_OUTBOX_MAX_ATTEMPTS', 8)
+
+    db.session.execute(
+        update(OutboxEmail)
+        .where(expired, out_of_attempts)
+        .values(status='failed', claim_token=None, last_error='Claim expired on every attempt')
+        .execution_options(synchronize_session=False)
+    )
+
+    claimable = or_(
+        and_(OutboxEmail.status == 'pending', OutboxEmail.next_attempt_at <= now),
+        expired
+    )
+    due_ids = select(OutboxEmail.id).where(claimable).order_by(OutboxEmail.id).limit(limit)
+    # The condition is repeated on the update so a row claimed concurrently is skipped, not stolen
+    db.session.execute(
+        update(OutboxEmail)
+        .where(OutboxEmail.id.in_(due_ids.scalar_subquery()), claimable)
+        .values(status='sending', claim_token=token, claimed_at=now, attempts=OutboxEmail.attempts + 1)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+    return OutboxEmail.query.filter_by(claim_token=token).order_by(OutboxEmail.id).all()
+
+
+def outbox_message(row):
+    return Message(
+        subject=row.subject,
+        recipients=json.loads(row.recipients),
+        body=row.body,
+        html=row.html,
+        sender=row.sender
+    )
+
+
+@shared_task
+def purge_sent_outbox():
+    """Delete sent emails older than MAIL_OUTBOX_RETENTION_DAYS, 1000 rows per transaction"""
+    cutoff = datetime.utcnow() - timedelta(days=current_app.config.get('MAIL_OUTBOX_RETENTION_DAYS', 30))
+    deleted = 0
+
+    while True:
+        ids = db.session.scalars(
+            select(OutboxEmail.id)
+            .where(OutboxEmail.status == 'sent', OutboxEmail.sent_at < cutoff)
+            .order_by(OutboxEmail.id)
+            .limit(1000)
+        ).all()
+        if not ids:
+            break
+
+        db.session.execute(delete(OutboxEmail).where(OutboxEmail.id.in_(ids)))
+        db.session.commit()
+        deleted += len(ids)
+
+    return f"Deleted {deleted} sent emails from the outbox"
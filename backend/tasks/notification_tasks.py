@@ -0,0 +1,122 @@
+from datetime import datetime, timedelta
+import time
+from celery import shared_task
+from flask import current_app
+from sqlalchemy import delete, insert, select
+from extensions import db
+from models import ServiceRequest, Professional, Notification, NotificationArchive
+from notifications import publish_notifications, unread_changed
+
+
+@shared_task
+def notify_new_service_request(service_request_id):
+    """Tell every approved professional of the service about a new request"""
+    service_request = db.session.get(ServiceRequest, service_request_id)
+    if service_request is None:
+        return f"Service request #{service_request_id} no longer exists"
+
+    user_ids = [
+        user_id for (user_id,) in db.session.query(Professional.user_id).filter_by(
+            service_id=service_request.service_id,
+            verification_status='approved'
+        )
+    ]
+
+    # The bulk insert bypasses the ORM events that keep unread counters and streams current
+    for user_id in user_ids:
+        unread_changed(user_id, 1)
+
+    notifications = Notification.bulk_create(
+        user_ids,
+        type='new_request',
+        message="A new service request is available in your area."
+    )
+    publish_notifications(notifications)
+
+    return f"Notified {len(notifications)} professionals of service request #{service_request_id}"
+
+
+@shared_task
+def archive_old_notifications():
+    """
+    Move read notifications older than NOTIFICATION_RETENTION_DAYS to notifications_archive
+    (or delete them when NOTIFICATION_RETENTION_MODE is 'delete').
+
+    Rows go in batches of NOTIFICATION_RETENTION_BATCH_SIZE, each its own short transaction,
+    with a pause in between so user writes to the table are never blocked for long.
+    """
+    config = current_app.config
+    cutoff = datetime.utcnow() - timedelta(days=config.get('NOTIFICATION_RETENTION_DAYS', 90))
+    mode = str(config.get('NOTIFICATION_RETENTION_MODE') or 'archive').strip().lower()
+    if mode not in ('archive', 'delete'):
+        # Never let a mistyped mode fall through to deleting notifications
+        current_app.logger.error(f"Skipping notification retention: unknown NOTIFICATION_RETENTION_MODE {mode!r}")
+        return f"Skipped: NOTIFICATION_RETENTION_MODE must be 'archive' or 'delete', not {mode!r}"
+    archive = mode == 'archive'
+    batch_size = config.get('NOTIFICATION_RETENTION_BATCH_SIZE', 1000)
+    pause = config.get('NOTIFICATION_RETENTION_BATCH_PAUSE', 0.1)
+
+    moved = 0
+    batches = 0
+    last_id = 0
+
+    while True:
+        ids = db.session.scalars(
+            select(Notification.id)
+            .where(
+                Notification.is_read == True,
+                Notification.created_at < cutoff,
+                Notification.id > last_id
+            )
+            .order_by(Notification.id)
+            .limit(batch_size)
+        ).all()
+
+        if not ids:
+            break
+
+        # The select's predicate is repeated so a row marked unread again since is left alone
+        expired = delete(Notification).where(
+            Notification.id.in_(ids),
+            Notification.is_read == True,
+            Notification.created_at < cutoff
+        )
+
+        try:
+            if archive:
+                # Archive exactly the rows the DELETE removed, in the same transaction
+                deleted = db.session.execute(expired.returning(
+                    Notification.id,
+                    Notification.user_id,
+                    Notification.type,
+                    Notification.message,
+                    Notification.is_read,
+                    Notification.created_at
+                )).mappings().all()
+                archived_at = datetime.utcnow()
+                if deleted:
+                    db.session.execute(
+                        insert(NotificationArchive),
+                        [dict(row, archived_at=archived_at) for row in deleted]
+                    )
+                count = len(deleted)
+            else:
+                count = db.session.execute(expired).rowcount
+            db.session.commit()
+
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"Notification retention stopped after {moved} rows: {str(e)}")
+            raise
+
+        moved += count
+        batches += 1
+        last_id = ids[-1]
+
+        if len(ids) < batch_size:
+            break
+        time.sleep(pause)
+
+    action = 'Archived' if archive else 'Deleted'
+    current_app.logger.info(f"{action} {moved} notifications older than {cutoff:%Y-%m-%d} in {batches} batches")
+    return f"{action} {moved} notifications in {batches} batches"
@@ -1,8 +1,9 @@
 from celery import shared_task
 from models.models import ServiceRequest, Professional, Notification
 from flask import current_app
-from mail_config import mail
+from mail_config import enqueue_email, enqueue_emails
 from flask_mail import Message
+from templating import render_template
 from datetime import datetime
 
 @shared_task
@@ -18,6 +19,7 @@ def send_daily_reminders():
     ).all()
     
     professionals_notified = set()
+    emails = []
     
     for request in pending_requests:
         if request.professional_id and request.professional_id not in professionals_notified:
@@ -40,28 +42,39 @@ def send_daily_reminders():
             notification.save_to_db()
             
             
-            send_external_notification(professional.user, notification.message)
+            email = external_notification_email(professional.user, notification.message)
+            if email:
+                # At most one reminder email per professional per day, however often this runs
+                emails.append((email, f"reminder:{professional.id}:{datetime.utcnow().date()}"))
             
             professionals_notified.add(professional.id)
     
+    enqueue_emails(emails)
     return f"Sent reminders to {len(professionals_notified)} professionals"
 
 
+def external_notification_email(user, message):
+    """The email copy of a notification, or None if the user has no email address"""
+    if not user.email:
+        return None
+    return Message(
+        subject="Service Sphere Notification",
+        recipients=[user.email],
+        body=render_template('emails/notification.txt', name=user.name, message=message)
+    )
+
+
 def send_external_notification(user, message):
     """
     Helper function to send notifications through external services
     """
-    if(user.email):
+    msg = external_notification_email(user, message)
+    if msg:
         try:
-            msg = Message(
-                subject="Service Sphere Notification",
-                recipients=[user.email],
-                body=f"Hello {user.name},\n\n{message}\n\nBest regards, \n Service Sphere Team"
-            )
-            mail.send(msg)
-            current_app.logger.info(f"Email sent to {user.email}")
+            enqueue_email(msg)
+            current_app.logger.info(f"Email queued for {user.email}")
         except Exception as e:
-            current_app.logger.error(f"Failed to send email: {str(e)}")
+            current_app.logger.error(f"Failed to queue email: {str(e)}")
     
     
     
@@ -81,6 +94,8 @@ def check_overdue_requests():
         ServiceRequest.scheduled_date < today
     ).all()
     
+    emails = []
+
     for request in overdue_requests:
         # Notify customer
         customer_notification = Notification(
@@ -100,6 +115,9 @@ def check_overdue_requests():
             prof_notification.save_to_db()
             
             # Send notification through external service
-            send_external_notification(request.professional.user, prof_notification.message)
+            email = external_notification_email(request.professional.user, prof_notification.message)
+            if email:
+                emails.append((email, f"overdue:{request.id}:{today.date()}"))
     
+    enqueue_emails(emails)
     return f"Processed {len(overdue_requests)} overdue requests"
@@ -1,97 +1,278 @@
-from celery import shared_task
-from models.models import Customer, ServiceRequest, User
+from celery import chord, shared_task
+from collections import namedtuple
+from itertools import groupby
+from operator import itemgetter
+from models.models import Customer, ServiceRequest, User, Service, Professional, Review, ReportRun, Notification
+from extensions import db
+from notifications import publish_notifications, unread_changed
 from datetime import datetime, timedelta
 import os
-import jinja2
 from flask import current_app
-from mail_config import mail
+from sqlalchemy import func, select
+from sqlalchemy.orm import aliased
+from mail_config import enqueue_email, enqueue_emails
+from templating import TEMPLATES_DIR, get_template, render_template
 from flask_mail import Message
 
+# Customer ids covered by each activity query and report task; bounds memory, and no read
+# stays open while mail is sent
+REPORT_CHUNK_SIZE = 1000
+# A chunk whose customers or template can't be loaded, or whose emails can't be queued, is
+# retried after 30s, 60s, 120s
+REPORT_CHUNK_RETRIES = 3
+REPORT_RETRY_BACKOFF = 30
+
+ReportCustomer = namedtuple('ReportCustomer', ['id', 'name', 'email'])
+
+
 @shared_task
 def send_monthly_activity_report():
+    """
+    Fan last month's reports out as one generate_report_chunk task per REPORT_CHUNK_SIZE customer
+    ids, so throughput scales with workers and a slow SMTP call only holds up its own chunk.
+    finish_report_run records the totals on a ReportRun once every chunk has finished.
+    """
     today = datetime.utcnow()
     first_day_of_month = datetime(today.year, today.month, 1)
     last_month = first_day_of_month - timedelta(days=1)
     month_num = last_month.month
     year_num = last_month.year
-    customers = Customer.query.join(User).filter(User.is_active == True).all()
-    reports_generated = 0
-    
-    for customer in customers:
+
+    ranges = customer_ranges()
+    report_run = ReportRun(
+        report_type='monthly_activity',
+        period=f"{year_num}-{month_num:02d}",
+        status='processing',
+        chunks=len(ranges)
+    )
+    report_run.save_to_db()
+
+    if not ranges:
+        return finish_report_run([], report_run.id)
+
+    chord(
+        generate_report_chunk.s(report_run.id, month_num, year_num, first_id, last_id)
+        for first_id, last_id in ranges
+    )(finish_report_run.s(report_run.id))
+
+    return f"Dispatched monthly reports for {report_run.period} in {len(ranges)} chunks"
+
+
+@shared_task(bind=True, max_retries=REPORT_CHUNK_RETRIES)
+def generate_report_chunk(self, run_id, month, year, first_id, last_id):
+    """
+    Render the reports of one customer id range and queue them in the mail outbox; returns
+    the chunk's counts.
+
+    Loading the chunk and its template, and queueing its emails, are retried (with exponential
+    backoff); a report that fails to render is counted against that customer. Emails are keyed
+    by customer and month, so running a chunk or the whole month again never emails anyone twice,
+    and only newly queued emails count as generated.
+    """
+    try:
+        activity = list(customer_activity(month, year, (first_id, last_id)))
+        active_customers = count_active_customers(first_id, last_id)
+        template = load_report_template()
+    except Exception as e:
+        return retry_report_chunk(self, e, run_id, first_id, last_id)
+
+    counts = {
+        'generated': 0,
+        'skipped': active_customers - len(activity),
+        'failed': 0,
+        'already_queued': 0,
+        'failed_chunks': 0
+    }
+    emails = []
+
+    for customer, requests in activity:
         try:
-            
-            start_date = datetime(year_num, month_num, 1)
-            if month_num == 12:
-                end_date = datetime(year_num + 1, 1, 1)
+            report_path = generate_customer_report(customer, requests, month, year, template)
+            message = report_email(customer, report_path, month, year) if report_path else None
+
+            if message:
+                emails.append((message, report_email_key(customer, month, year)))
             else:
-                end_date = datetime(year_num, month_num + 1, 1)
-            
-            request_count = ServiceRequest.query.filter(
-                ServiceRequest.customer_id == customer.id,
-                ServiceRequest.request_date >= start_date,
-                ServiceRequest.request_date < end_date
-            ).count()
-            report_path = generate_customer_report(customer, month_num, year_num)
-
-            if report_path:
-                send_report_email(customer,report_path,month_num,year_num)
-                reports_generated += 1
+                counts['failed'] += 1
         except Exception as e:
+            counts['failed'] += 1
             current_app.logger.error(f"Failed to generate report for customer {customer.id}: {str(e)}")
-    
-    return f"Generated monthly reports for {reports_generated} customers"
 
-def generate_customer_report(customer, month, year):
-    
+    # One insert for the whole chunk; drain_outbox does the sending
+    try:
+        counts['generated'] = enqueue_emails(emails)
+    except Exception as e:
+        return retry_report_chunk(self, e, run_id, first_id, last_id)
+    counts['already_queued'] = len(emails) - counts['generated']
+
+    return counts
+
+
+def retry_report_chunk(task, error, run_id, first_id, last_id):
+    """Retry a chunk with exponential backoff; once out of retries, count it as a failed chunk"""
+    db.session.rollback()
+    if task.request.retries < task.max_retries:
+        raise task.retry(exc=error, countdown=REPORT_RETRY_BACKOFF * 2 ** task.request.retries)
+
+    # Returning (rather than raising) keeps the chord going, so finish_report_run still closes the run
+    current_app.logger.error(f"Report run {run_id}: customers {first_id}-{last_id} failed: {str(error)}")
+    return {'generated': 0, 'skipped': 0, 'failed': 0, 'already_queued': 0, 'failed_chunks': 1}
+
+
+@shared_task
+def finish_report_run(chunk_counts, run_id):
+    """Chord callback: store the run's totals and tell the admins how it went"""
+    report_run = db.session.get(ReportRun, run_id)
+    if report_run is None:
+        return f"Report run {run_id} not found"
+
+    for field in ('generated', 'skipped', 'failed', 'already_queued', 'failed_chunks'):
+        # .get: chunks that finished before already_queued was counted
+        setattr(report_run, field, sum(counts.get(field, 0) for counts in chunk_counts))
+    report_run.status = 'failed' if report_run.chunks and report_run.failed_chunks == report_run.chunks else 'completed'
+    report_run.completed_at = datetime.utcnow()
+    report_run.save_to_db()
+
+    summary = (
+        f"Monthly activity reports for {report_run.period}: {report_run.generated} queued for delivery, "
+        f"{report_run.skipped} skipped (no activity), {report_run.failed} failed"
+    )
+    if report_run.already_queued:
+        summary += f", {report_run.already_queued} already queued by an earlier run"
+    if report_run.failed_chunks:
+        summary += f", {report_run.failed_chunks} of {report_run.chunks} chunks could not be processed"
+
+    admin_ids = [user_id for (user_id,) in db.session.query(User.id).filter_by(role='admin')]
+    # The bulk insert bypasses the ORM events that keep unread counters and streams current
+    for user_id in admin_ids:
+        unread_changed(user_id, 1)
+    publish_notifications(Notification.bulk_create(admin_ids, type='report_run', message=summary + "."))
+
+    return summary
+
+
+def customer_ranges():
+    """Inclusive (first_id, last_id) ranges of REPORT_CHUNK_SIZE customer ids"""
+    low, high = db.session.query(func.min(Customer.id), func.max(Customer.id)).one()
+    if low is None:
+        return []
+    return [
+        (first_id, min(first_id + REPORT_CHUNK_SIZE - 1, high))
+        for first_id in range(low, high + 1, REPORT_CHUNK_SIZE)
+    ]
+
+
+def count_active_customers(first_id, last_id):
+    return (
+        db.session.query(func.count(Customer.id))
+        .join(User, Customer.user_id == User.id)
+        .filter(User.is_active == True, Customer.id.between(first_id, last_id))
+        .scalar()
+    )
+
+
+def report_period(month, year):
     start_date = datetime(year, month, 1)
     if month == 12:
         end_date = datetime(year + 1, 1, 1)
     else:
         end_date = datetime(year, month + 1, 1)
-    
-    requests = ServiceRequest.query.filter(
-        ServiceRequest.customer_id == customer.id,
-        ServiceRequest.request_date >= start_date,
-        ServiceRequest.request_date < end_date
-    ).all()
+    return start_date, end_date
+
+
+def customer_activity(month, year, customer_range=None):
+    """
+    Group one month of service requests by customer, from a single joined, date-ranged query.
+    Yields (ReportCustomer, [request dicts]) only for active customers with requests that month,
+    optionally limited to an inclusive range of customer ids.
+    """
+    start_date, end_date = report_period(month, year)
+    customer_user = aliased(User)
+    professional_user = aliased(User)
+
+    query = (
+        select(
+            ServiceRequest.customer_id,
+            customer_user.name,
+            customer_user.email,
+            ServiceRequest.id,
+            Service.name,
+            ServiceRequest.status,
+            ServiceRequest.request_date,
+            ServiceRequest.completion_date,
+            professional_user.name,
+            Service.base_price,
+            Review.rating
+        )
+        .join(Customer, ServiceRequest.customer_id == Customer.id)
+        .join(customer_user, Customer.user_id == customer_user.id)
+        .join(Service, ServiceRequest.service_id == Service.id)
+        .outerjoin(Professional, ServiceRequest.professional_id == Professional.id)
+        .outerjoin(professional_user, Professional.user_id == professional_user.id)
+        .outerjoin(Review, Review.service_request_id == ServiceRequest.id)
+        .where(
+            customer_user.is_active == True,
+            ServiceRequest.request_date >= start_date,
+            ServiceRequest.request_date < end_date
+        )
+        .order_by(ServiceRequest.customer_id, ServiceRequest.request_date, ServiceRequest.id, Review.id)
+    )
+    if customer_range is not None:
+        query = query.where(ServiceRequest.customer_id.between(*customer_range))
+
+    rows = db.session.execute(query).all()
 
+    for customer_id, customer_rows in groupby(rows, key=itemgetter(0)):
+        customer = None
+        requests = []
+        for (_, name, email, request_id, service_name, status, request_date,
+                completion_date, professional_name, price, rating) in customer_rows:
+            if customer is None:
+                customer = ReportCustomer(customer_id, name, email)
+            if requests and requests[-1]['id'] == request_id:
+                # Further reviews of the same request; the report shows the first one
+                continue
+            requests.append({
+                'id': request_id,
+                'service_name': service_name,
+                'status': status,
+                'request_date': request_date.strftime('%Y-%m-%d'),
+                'completion_date': completion_date.strftime('%Y-%m-%d') if completion_date else None,
+                'professional_name': professional_name,
+                'price': price,
+                'rating': rating
+            })
+        yield customer, requests
+
+
+def load_report_template():
+    """The report template, compiled once per process by the shared environment"""
+    template_path = os.path.join(TEMPLATES_DIR, 'monthly_report.html')
+    if not os.path.exists(template_path):
+        os.makedirs(TEMPLATES_DIR, exist_ok=True)
+        create_report_template(template_path)
+
+    return get_template('monthly_report.html')
+
+
+def generate_customer_report(customer, requests, month, year, template=None):
+    """Render a customer's report from their requests in customer_activity() form"""
     if not requests:
         return None
-    
+
+    start_date, _ = report_period(month, year)
     report_data = {
-        'customer_name': customer.user.name,
+        'customer_name': customer.name,
         'month': start_date.strftime('%B %Y'),
         'total_requests': len(requests),
-        'completed_requests': sum(1 for r in requests if r.status == 'closed'),
-        'pending_requests': sum(1 for r in requests if r.status in ['requested', 'assigned']),
-        'cancelled_requests': sum(1 for r in requests if r.status == 'cancelled'),
-        'total_spent': sum(r.service.base_price for r in requests if r.status == 'closed'),
-        'requests': [
-            {
-                'id': r.id,
-                'service_name': r.service.name,
-                'status': r.status,
-                'request_date': r.request_date.strftime('%Y-%m-%d'),
-                'completion_date': r.completion_date.strftime('%Y-%m-%d') if r.completion_date else None,
-                'professional_name': r.professional.user.name if r.professional else None,
-                'price': r.service.base_price,
-                'rating': r.reviews[0].rating if r.reviews else None
-            }
-            for r in requests
-        ]
+        'completed_requests': sum(1 for r in requests if r['status'] == 'closed'),
+        'pending_requests': sum(1 for r in requests if r['status'] in ['requested', 'assigned']),
+        'cancelled_requests': sum(1 for r in requests if r['status'] == 'cancelled'),
+        'total_spent': sum(r['price'] for r in requests if r['status'] == 'closed'),
+        'requests': requests
     }
 
-    templates_dir = os.path.join(current_app.root_path, 'templates')
-    os.makedirs(templates_dir, exist_ok=True)
-
-    template_path = os.path.join(templates_dir, 'monthly_report.html')
-    if not os.path.exists(template_path):
-        create_report_template(template_path)
-
-    with open(template_path, 'r') as f:
-        template_content = f.read()
-        
-    template = jinja2.Template(template_content)
+    template = template or load_report_template()
     html_output = template.render(**report_data)
 
     reports_dir = os.path.join(current_app.root_path, 'static', 'reports')
@@ -276,38 +457,42 @@ def create_report_template(template_path):
     
     return True
 
-def send_report_email(customer, report_path, month, year):
+def report_email(customer, report_path, month, year):
     """
-    Send email with attached monthly report using Flask-Mail
+    The monthly report email for a customer, or None if they have no email address
     """
-    if not customer.user.email:
-        return False
+    if not customer.email:
+        return None
     
     month_name = datetime(year, month, 1).strftime('%B %Y')
     
-    try:
-        
-        msg = Message(
-            subject=f"Your Monthly Activity Report - {month_name}",
-            recipients=[customer.user.email]
-        )
-        
-        
-        msg.body = f"""Dear {customer.user.name},
+    msg = Message(
+        subject=f"Your Monthly Activity Report - {month_name}",
+        recipients=[customer.email]
+    )
+    
+    msg.body = render_template('emails/monthly_report.txt', name=customer.name, month_name=month_name)
+    with open(report_path, 'r') as f:
+        msg.html = f.read()
 
-Please find attached your monthly activity report for {month_name}.
-Thank you for using our platform.
+    return msg
 
-Regards,
-The Service Sphere Team
-"""
-        with open(report_path, 'r') as f:
-            msg.html = f.read()
 
-        current_app.logger.info(f"Sending report email to {customer.user.email}")
-        mail.send(msg)
-        
-        current_app.logger.info(f"Report email sent to {customer.user.email}")
+def report_email_key(customer, month, year):
+    return f"monthly_report:{customer.id}:{year}-{month:02d}"
+
+
+def send_report_email(customer, report_path, month, year):
+    """
+    Queue the monthly report email in the mail outbox
+    """
+    try:
+        msg = report_email(customer, report_path, month, year)
+        if msg is None:
+            return False
+
+        enqueue_email(msg, report_email_key(customer, month, year))
+        current_app.logger.info(f"Report email queued for {customer.email}")
         return True
         
     except Exception as e:
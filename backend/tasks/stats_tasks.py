@@ -0,0 +1,11 @@
+from celery import shared_task
+from stats import reconcile_stats
+
+@shared_task
+def reconcile_dashboard_stats():
+    """
+    Recompute the dashboard counters from SQL to correct any drift
+    (bulk statements, Redis restarts, failed increments).
+    """
+    totals = reconcile_stats()
+    return f"Reconciled dashboard stats: {totals}"
@@ -0,0 +1,35 @@
+import os
+import jinja2
+from flask import current_app, has_app_context
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+
+# Compiled templates are cached by the environment for the life of the process, so reports and
+# emails only pay for rendering. auto_reload (a stat() per lookup) follows TEMPLATES_AUTO_RELOAD,
+# or debug when that is unset, as Flask's own environment does.
+environment = jinja2.Environment(
+    loader=jinja2.FileSystemLoader(TEMPLATES_DIR),
+    auto_reload=False,
+    keep_trailing_newline=True
+)
+
+
+def init_templating(app):
+    """Apply the app's optional TEMPLATE_BYTECODE_CACHE_DIR to the shared environment"""
+    # Lets new worker processes skip compiling templates another process already compiled
+    cache_dir = app.config.get('TEMPLATE_BYTECODE_CACHE_DIR')
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        environment.bytecode_cache = jinja2.FileSystemBytecodeCache(cache_dir)
+
+
+def get_template(template_name):
+    # Read at lookup time, not in create_app: app.run(debug=True) only turns debug on afterwards
+    if has_app_context():
+        auto_reload = current_app.config.get('TEMPLATES_AUTO_RELOAD')
+        environment.auto_reload = current_app.debug if auto_reload is None else auto_reload
+    return environment.get_template(template_name)
+
+
+def render_template(template_name, **context):
+    return get_template(template_name).render(**context)
@@ -1,32 +1,200 @@
+from datetime import timedelta
 from functools import wraps
-from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
-from models import User
+import time
+from flask import abort, current_app, g
+from flask_jwt_extended import get_jwt, get_jwt_identity, verify_jwt_in_request
+from werkzeug.local import LocalProxy
+import redis
+from extensions import db, jwt, redis_client
+from models import User, Customer, Professional
+
+INACTIVE_USERS_KEY = 'auth:inactive_users'
+# Sorted set of deleted user ids scored by deletion time; sync_inactive_users never touches it,
+# since a deleted user has no row left to rebuild from
+DELETED_USERS_KEY = 'auth:deleted_users'
+
+
+class Principal:
+    """The authenticated caller, built from the JWT claims without touching the database"""
+
+    def __init__(self, user_id, role, customer_id=None, professional_id=None):
+        self.user_id = user_id
+        self.role = role
+        self.customer_id = customer_id
+        self.professional_id = professional_id
+        self._user = None
+        self._customer = None
+        self._professional = None
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(
+            user.id,
+            user.role,
+            user.customer.id if user.customer else None,
+            user.professional.id if user.professional else None
+        )
+
+    @property
+    def user(self):
+        if self._user is None:
+            self._user = db.session.get(User, self.user_id)
+        return self._user
+
+    @property
+    def customer(self):
+        if self._customer is None and self.customer_id is not None:
+            self._customer = db.session.get(Customer, self.customer_id)
+        return self._customer
+
+    @property
+    def professional(self):
+        if self._professional is None and self.professional_id is not None:
+            self._professional = db.session.get(Professional, self.professional_id)
+        return self._professional
+
+    def customer_id_or_404(self):
+        if self.customer_id is None:
+            abort(404)
+        return self.customer_id
+
+    def professional_or_404(self):
+        if self.professional is None:
+            abort(404)
+        return self.professional
+
+
+def principal_claims(user):
+    """Additional JWT claims that let requests resolve the caller without a lookup"""
+    return {
+        'role': user.role,
+        'customer_id': user.customer.id if user.customer else None,
+        'professional_id': user.professional.id if user.professional else None,
+    }
+
+
+def get_current_principal():
+    """Principal for the current request, cached on flask.g; 404s if the user no longer exists"""
+    claims = get_jwt()
+
+    # g outlives a single request when an app context is already pushed, so key the cache by token
+    cached = g.get('principal')
+    if cached is not None and cached[0] == claims['jti']:
+        return cached[1]
+
+    user_id = int(get_jwt_identity())
+    if 'role' in claims:
+        principal = Principal(user_id, claims['role'], claims.get('customer_id'), claims.get('professional_id'))
+    else:
+        # Tokens issued before the role/profile claims were added
+        user = db.session.get(User, user_id)
+        if user is None:
+            abort(404, description="User not found")
+        principal = Principal.from_user(user)
+
+    g.principal = (claims['jti'], principal)
+    return principal
+
+
+current_principal = LocalProxy(get_current_principal)
+
+
+def sync_inactive_users():
+    """Rebuild the Redis set of deactivated user ids from the database"""
+    inactive_ids = [user_id for (user_id,) in db.session.query(User.id).filter(User.is_active == False)]
+
+    pipe = redis_client.pipeline()
+    pipe.delete(INACTIVE_USERS_KEY)
+    # 0 is never a user id; it keeps the key present when nobody is inactive
+    pipe.sadd(INACTIVE_USERS_KEY, 0, *inactive_ids)
+    pipe.execute()
+
+
+def is_user_inactive(user_id):
+    try:
+        pipe = redis_client.pipeline()
+        pipe.exists(INACTIVE_USERS_KEY)
+        pipe.sismember(INACTIVE_USERS_KEY, user_id)
+        pipe.zscore(DELETED_USERS_KEY, user_id)
+        key_exists, inactive, deleted_at = pipe.execute()
+
+        if deleted_at is not None:
+            return True
+        if not key_exists:
+            sync_inactive_users()
+            inactive = redis_client.sismember(INACTIVE_USERS_KEY, user_id)
+        return bool(inactive)
+
+    except redis.RedisError:
+        user = db.session.get(User, user_id)
+        return user is None or not user.is_active
+
+
+def set_user_active(user_id, is_active):
+    """Propagate an activation change to the inactive-users set"""
+    try:
+        if is_active:
+            redis_client.srem(INACTIVE_USERS_KEY, user_id)
+        else:
+            redis_client.sadd(INACTIVE_USERS_KEY, user_id)
+    except redis.RedisError as e:
+        current_app.logger.error(f"Failed to update inactive users for user {user_id}: {str(e)}")
+
+
+def _longest_token_lifetime():
+    """Seconds until every token issued now has expired, or None if some never expire"""
+    lifetimes = []
+    for key in ('JWT_ACCESS_TOKEN_EXPIRES', 'JWT_REFRESH_TOKEN_EXPIRES'):
+        lifetime = current_app.config.get(key)
+        if lifetime is False:
+            return None
+        lifetimes.append(lifetime.total_seconds() if isinstance(lifetime, timedelta) else lifetime)
+    return max(lifetimes)
+
+
+def mark_user_deleted(user_id):
+    """Refuse a deleted user's outstanding tokens until the longest-lived of them has expired"""
+    now = time.time()
+    lifetime = _longest_token_lifetime()
+    try:
+        pipe = redis_client.pipeline()
+        pipe.zadd(DELETED_USERS_KEY, {user_id: now})
+        if lifetime is not None:
+            # Entries older than any token still in circulation have nothing left to refuse
+            pipe.zremrangebyscore(DELETED_USERS_KEY, '-inf', now - lifetime)
+        pipe.execute()
+    except redis.RedisError as e:
+        current_app.logger.error(f"Failed to record deletion of user {user_id}: {str(e)}")
+
+
+@jwt.token_verification_loader
+def check_user_active(jwt_header, jwt_payload):
+    """Refuse every protected endpoint, not just role_required ones, to deactivated and deleted users"""
+    if is_user_inactive(int(jwt_payload[current_app.config['JWT_IDENTITY_CLAIM']])):
+        # An HTTPException, unlike a failed verification, reaches the client as a 403 through flask-restful
+        abort(403, description="User account is inactive")
+    return True
+
 
 def role_required(roles):
     """Decorator to require at least one role from a list."""
-    
+
     def decorator(fn):
         @wraps(fn)
         def wrapper(*args, **kwargs):
             verify_jwt_in_request()
-            user_id = get_jwt_identity()
-            user = User.query.get(user_id)
-
-            if not user:
-                return {"message": "User not found"}, 404
-            
-            if not user.is_active:
-                return {"message": "User account is inactive"}, 403
-            
-            if user.role not in roles and user.role != 'admin':
+            # verify_jwt_in_request has already refused inactive users (check_user_active)
+            principal = get_current_principal()
+
+            if principal.role not in roles and principal.role != 'admin':
                 return {"message": "Access denied. Required roles: " + ", ".join(roles)}, 403
-            
+
             return fn(*args, **kwargs)
-        
+
         return wrapper
     return decorator
 
 
 admin_required = role_required(['admin'])
 customer_required = role_required(['customer'])
-professional_required = role_required(['professional'])
\ No newline at end of file
+professional_required = role_required(['professional'])
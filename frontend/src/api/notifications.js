@@ -1,4 +1,5 @@
 import api from ".";
+import { getToken } from "@/utils/authutils";
 
 export function getNotifications(params = {}) {
     return api.get('/notifications', { params })
@@ -14,4 +15,17 @@ export function markAllAsRead() {
 
 export function deleteNotification(id) {
     return api.delete(`/notifications/${id}`)
-}
\ No newline at end of file
+}
+
+export function getUnreadCount() {
+    return api.get('/notifications/unread-count')
+}
+
+
+export function openNotificationStream(lastEventId = null) {
+    const params = new URLSearchParams({ jwt: getToken() })
+    if (lastEventId) {
+        params.set('last_event_id', lastEventId)
+    }
+    return new EventSource(`${api.defaults.baseURL}/notifications/stream?${params}`)
+}
@@ -107,7 +107,7 @@ export const useAuthStore = defineStore('auth', {
             const token = getToken();
 
             try {
-                await axios.post('/logout', {}, {
+                await axios.post('/logout', { refresh_token: getRefreshToken() }, {
                     headers: {
                         Authorization: `Bearer ${token}`
                     }
@@ -1,5 +1,9 @@
 import { defineStore } from "pinia";
-import { getNotifications, markAllAsRead, markAsRead, deleteNotification } from "@/api/notifications";
+import { getNotifications, getUnreadCount, markAllAsRead, markAsRead, deleteNotification, openNotificationStream } from "@/api/notifications";
+
+const STREAM_RECONNECT_DELAY = 5000
+let stream = null
+let reconnectTimer = null
 
 
 export const useNotificationsStore = defineStore("notifications", {
@@ -7,7 +11,9 @@ export const useNotificationsStore = defineStore("notifications", {
         notifications: [],
         loading: false,
         error: null,
-        unreadCount: 0
+        unreadCount: 0,
+        lastEventId: null,
+        lastServiceRequestEvent: null
     }),
     getters: {
         unreadNotifications: (state) => {
@@ -29,6 +35,9 @@ export const useNotificationsStore = defineStore("notifications", {
                 const response = await getNotifications(params)
                 this.notifications = response.data.notifications
                 this.unreadCount = response.data.unread_count
+                if (this.notifications.length) {
+                    this.lastEventId = Math.max(...this.notifications.map(n => n.id))
+                }
                 return response.data.notifications
             } catch (error) {
                 this.error = error.response?.data?.message || 'Failed to fetch notifications'
@@ -37,6 +46,58 @@ export const useNotificationsStore = defineStore("notifications", {
                 this.loading = false
             }
         },
+        connectStream() {
+            this.disconnectStream()
+
+            stream = openNotificationStream(this.lastEventId)
+
+            stream.addEventListener('notification', (event) => {
+                const notification = JSON.parse(event.data)
+                this.lastEventId = event.lastEventId
+                if (!this.notifications.some(n => n.id === notification.id)) {
+                    this.notifications.unshift(notification)
+                    if (!notification.is_read) {
+                        this.unreadCount += 1
+                    }
+                }
+            })
+
+            stream.addEventListener('service_request', (event) => {
+                // The request views watch this and refresh the affected row
+                this.lastServiceRequestEvent = JSON.parse(event.data)
+            })
+
+            stream.addEventListener('resync', (event) => {
+                this.lastEventId = event.lastEventId || null
+                this.fetchNotifications({ limit: 5 })
+            })
+
+            stream.onerror = () => {
+                // The browser retries dropped connections itself; a refused one (e.g. expired token) is closed for good
+                if (stream && stream.readyState === EventSource.CLOSED) {
+                    reconnectTimer = setTimeout(() => this.connectStream(), STREAM_RECONNECT_DELAY)
+                }
+            }
+        },
+
+        disconnectStream() {
+            clearTimeout(reconnectTimer)
+            if (stream) {
+                stream.close()
+                stream = null
+            }
+        },
+
+        async fetchUnreadCount() {
+            try {
+                const response = await getUnreadCount()
+                this.unreadCount = response.data.unread_count
+                return this.unreadCount
+            } catch (error) {
+                this.error = error.response?.data?.message || 'Failed to fetch unread count'
+                throw error
+            }
+        },
         async markNotificationAsRead(id) {
             this.loading = true
             this.error = null
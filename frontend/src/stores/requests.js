@@ -109,6 +109,27 @@ export const useRequestStore = defineStore("requests", {
             }
         },
 
+        async refreshRequest(id) {
+            // Background refresh of one row (e.g. after a pushed status change); leaves the loading flag alone
+            const response = await getServiceRequest(id)
+            const request = response.data.service_request
+
+            const index = this.requests.findIndex(r => r.id === id)
+            if (index !== -1) {
+                this.requests[index] = request
+            }
+
+            if (this.currentRequest && this.currentRequest.id === id) {
+                this.currentRequest = request
+            }
+
+            if (request.status !== 'requested') {
+                this.availableRequests = this.availableRequests.filter(r => r.id !== id)
+            }
+
+            return request
+        },
+
         async createNewRequest(requestData) {
             this.loading = true
             this.error = null